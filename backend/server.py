@@ -1,25 +1,476 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Cookie, Response
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Cookie, Header, Query, Request, Response
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, CursorType, IndexModel, ReplaceOne, ReturnDocument, UpdateOne, monitoring, read_preferences
+from pymongo.errors import BulkWriteError, CollectionInvalid, ConnectionFailure, DuplicateKeyError, OperationFailure
 import os
+import re
+import abc
+import sys
+import collections
+import contextvars
+import asyncio
+import bisect
+import itertools
+import base64
+import json
+import zlib
 import logging
+import threading
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from urllib.parse import parse_qs
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Optional, Union
+import numpy as np
 import uuid
+import time
 from datetime import datetime, timezone, timedelta
-import requests
+import hashlib
+from contextlib import asynccontextmanager
+from cachetools import TLRUCache, TTLCache
+import httpx
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_exponential
 from emergentintegrations.llm.chat import LlmChat, UserMessage
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Metrics
+# Rendered in the Prometheus text format without the client library. The Mongo command
+# listener is called from driver threads, so histograms guard their state with a lock.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+EVENT_LOOP_LAG_INTERVAL_SECONDS = float(os.environ.get('EVENT_LOOP_LAG_INTERVAL_SECONDS', '0.5'))
+
+def metric_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"'.replace("\n", " ") for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {key: {**series, "buckets": list(series["buckets"])} for key, series in self._series.items()}
+        for label_values, series in sorted(snapshot.items()):
+            for bound, count in list(zip(self.buckets, series["buckets"])) + [("+Inf", series["count"])]:
+                bucket_labels = metric_labels(self.labels, label_values, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+            lines.append(f"{self.name}_sum{metric_labels(self.labels, label_values)} {series['sum']}")
+            lines.append(f"{self.name}_count{metric_labels(self.labels, label_values)} {series['count']}")
+        return lines
+
+def gauge_lines(name: str, help_text: str, value, kind: str = "gauge") -> List[str]:
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+
+http_request_latency = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route", "status")
+)
+mongo_command_latency = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency by collection.", ("collection", "command", "outcome")
+)
+llm_request_latency = Histogram(
+    "llm_request_duration_seconds", "AI coach completion latency.", ("outcome",), buckets=(0.5, 1, 2, 5, 10, 20, 30, 60)
+)
+event_loop_lag = Histogram(
+    "event_loop_lag_seconds", "Delay between a scheduled wake-up and the event loop running it.", buckets=LAG_BUCKETS
+)
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every command the driver sends, labelled by collection."""
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        collection = event.command.get("collection" if event.command_name == "getMore" else event.command_name)
+        collection = collection if isinstance(collection, str) else ""
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = collection
+        trace = request_trace.get()
+        if trace is not None:
+            trace.command_started(event, collection)
+
+    def _finished(self, event, outcome: str):
+        with self._lock:
+            collection = self._pending.pop((event.connection_id, event.request_id), "")
+        mongo_command_latency.observe(event.duration_micros / 1e6, collection, event.command_name, outcome)
+        trace = request_trace.get()
+        if trace is not None:
+            trace.command_finished(event)
+
+    def succeeded(self, event):
+        self._finished(event, "ok")
+
+    def failed(self, event):
+        self._finished(event, "error")
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Tracks open, checked-out and waiting connections for each server's pool."""
+
+    def __init__(self):
+        self.pools = {}
+        self._lock = threading.Lock()
+
+    def _count(self, address, field: str, delta: int):
+        key = f"{address[0]}:{address[1]}"
+        with self._lock:
+            pool = self.pools.setdefault(key, {"open": 0, "checked_out": 0, "waiting": 0, "check_out_failures": 0})
+            pool[field] += delta
+
+    def pool_created(self, event):
+        self._count(event.address, "open", 0)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        with self._lock:
+            self.pools.pop(f"{event.address[0]}:{event.address[1]}", None)
+
+    def connection_created(self, event):
+        self._count(event.address, "open", 1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._count(event.address, "open", -1)
+
+    def connection_check_out_started(self, event):
+        self._count(event.address, "waiting", 1)
+
+    def connection_check_out_failed(self, event):
+        self._count(event.address, "waiting", -1)
+        self._count(event.address, "check_out_failures", 1)
+
+    def connection_checked_out(self, event):
+        self._count(event.address, "waiting", -1)
+        self._count(event.address, "checked_out", 1)
+
+    def connection_checked_in(self, event):
+        self._count(event.address, "checked_out", -1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                address: {**pool, "utilisation": round(pool["checked_out"] / MONGO_MAX_POOL_SIZE, 3)}
+                for address, pool in self.pools.items()
+            }
+
+class MetricsMiddleware:
+    """Plain ASGI middleware recording request latency against the matched route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        start = time.perf_counter()
+        status = 500
+        
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # FastAPI records the matched route in the (shared) scope while routing
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            http_request_latency.observe(time.perf_counter() - start, scope["method"], route_path, status)
+
+async def monitor_event_loop_lag():
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(EVENT_LOOP_LAG_INTERVAL_SECONDS)
+        event_loop_lag.observe(max(0.0, loop.time() - start - EVENT_LOOP_LAG_INTERVAL_SECONDS))
+
+mongo_command_metrics = MongoCommandMetrics()
+mongo_pool_metrics = MongoPoolMetrics()
+event_loop_lag_task: Optional[asyncio.Task] = None
+
+# Request tracing and profiling
+# Every request carries a trace (via a context variable, which Motor copies onto its executor
+# threads) of the Mongo commands it issued, and of the time it spent waiting on the LLM. Requests
+# that take longer than SLOW_REQUEST_MS of their own (LLM wait excluded) to send their response head
+# are logged with their timings and the query plan of each read; a given route and query shape is
+# explained at most once per SLOW_REQUEST_EXPLAIN_INTERVAL_SECONDS. Admins can also run a single
+# request under a sampling profiler by sending X-Profile: 1 (or ?profile=1) together with X-Admin-Token.
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', '500'))
+SLOW_REQUEST_EXPLAIN_INTERVAL_SECONDS = float(os.environ.get('SLOW_REQUEST_EXPLAIN_INTERVAL_SECONDS', '300'))
+SLOW_REQUEST_LOG_SIZE = int(os.environ.get('SLOW_REQUEST_LOG_SIZE', '100'))
+PROFILE_SAMPLE_INTERVAL_SECONDS = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_SECONDS', '0.005'))
+PROFILE_STORE_SIZE = int(os.environ.get('PROFILE_STORE_SIZE', '20'))
+EXPLAINABLE_FIELDS = {
+    "find": ("filter", "sort", "projection", "limit", "skip", "hint"),
+    "aggregate": ("pipeline", "cursor"),
+    "count": ("query", "limit", "skip"),
+    "distinct": ("key", "query"),
+}
+
+class RequestTrace:
+    def __init__(self):
+        self.commands = []
+        self.upstream_ms = 0.0
+        self._pending = {}
+
+    def command_started(self, event, collection: str):
+        entry = {"collection": collection, "command": event.command_name, "duration_ms": None}
+        fields = EXPLAINABLE_FIELDS.get(event.command_name)
+        if fields:
+            entry["explain"] = {
+                event.command_name: collection,
+                **{field: event.command[field] for field in fields if field in event.command}
+            }
+        self._pending[(event.connection_id, event.request_id)] = entry
+        self.commands.append(entry)
+
+    def command_finished(self, event):
+        entry = self._pending.pop((event.connection_id, event.request_id), None)
+        if entry is not None:
+            entry["duration_ms"] = round(event.duration_micros / 1000, 2)
+
+request_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar("request_trace", default=None)
+slow_requests = collections.deque(maxlen=SLOW_REQUEST_LOG_SIZE)
+explained_shapes = TTLCache(maxsize=1024, ttl=SLOW_REQUEST_EXPLAIN_INTERVAL_SECONDS)
+profiles = collections.OrderedDict()
+background_tasks = set()
+
+def run_in_background(coro, context: Optional[contextvars.Context] = None) -> asyncio.Task:
+    """Start coro without awaiting it; the loop only keeps weak references to tasks, so we hold one."""
+    task = asyncio.get_running_loop().create_task(coro, context=context)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+class SamplingProfiler:
+    """Samples one thread's stack from a helper thread and folds the samples into collapsed stacks."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = collections.Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{Path(code.co_filename).name}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> str:
+        """Stop sampling and return the profile in the folded format flamegraph.pl and speedscope read."""
+        self._stopped.set()
+        self._thread.join()
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+def plan_summary(explain: dict) -> str:
+    planner = explain.get("queryPlanner")
+    if planner is None:
+        # Aggregations report the plan of their leading $cursor stage
+        for stage in explain.get("stages", []):
+            if "$cursor" in stage:
+                planner = stage["$cursor"].get("queryPlanner")
+                break
+    plan = (planner or {}).get("winningPlan", {})
+    plan = plan.get("queryPlan", plan)
+    stages = []
+    while plan:
+        stage = plan.get("stage", "?")
+        if plan.get("indexName"):
+            stage += f" {plan['indexName']}"
+        stages.append(stage)
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    return " <- ".join(stages) or "unknown"
+
+def query_shape(value):
+    """The structure of a command with every literal replaced, so similar queries compare equal."""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return sorted({json.dumps(query_shape(item), sort_keys=True) for item in value})
+    return 1
+
+async def record_slow_request(method: str, path: str, route: str, status: int, elapsed_ms: float, trace: RequestTrace):
+    commands = []
+    for entry in trace.commands:
+        command = {key: entry[key] for key in ("collection", "command", "duration_ms")}
+        shape = (route, entry["collection"], json.dumps(query_shape(entry.get("explain")), sort_keys=True))
+        if "explain" in entry and shape not in explained_shapes:
+            explained_shapes[shape] = True
+            try:
+                explain = await db.command({"explain": entry["explain"], "verbosity": "queryPlanner"})
+                command["plan"] = plan_summary(explain)
+            except Exception as e:
+                command["plan"] = f"explain failed: {e}"
+        commands.append(command)
+    record = {
+        "at": datetime.now(timezone.utc).isoformat(),
+        "method": method,
+        "path": path,
+        "route": route,
+        "status": status,
+        "duration_ms": round(elapsed_ms, 2),
+        "upstream_ms": round(trace.upstream_ms, 2),
+        "mongo_ms": round(sum(c["duration_ms"] or 0 for c in commands), 2),
+        "commands": commands,
+    }
+    slow_requests.append(record)
+    logger.warning(f"Slow request: {json.dumps(record, default=str)}")
+
+def profiling_requested(scope) -> bool:
+    admin_token = os.environ.get('ADMIN_TOKEN')
+    if not admin_token:
+        return False
+    headers = dict(scope.get("headers") or [])
+    if headers.get(b"x-admin-token", b"").decode() != admin_token:
+        return False
+    query = parse_qs(scope.get("query_string", b"").decode())
+    return headers.get(b"x-profile") == b"1" or query.get("profile") == ["1"]
+
+class RequestTraceMiddleware:
+    """Traces Mongo usage per request, logs slow requests and runs opt-in profiles."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        trace = RequestTrace()
+        token = request_trace.set(trace)
+        profiler = None
+        profile_id = None
+        if profiling_requested(scope):
+            profiler = SamplingProfiler(threading.get_ident(), PROFILE_SAMPLE_INTERVAL_SECONDS)
+            profile_id = str(uuid.uuid4())
+            profiler.start()
+        status = 500
+        start = time.perf_counter()
+        elapsed_ms = None
+        
+        async def send_traced(message):
+            nonlocal status, elapsed_ms
+            if message["type"] == "http.response.start":
+                # Timed to the response head: streamed bodies (exports, coach answers) are paced by
+                # the client or the model, not by our handlers
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                status = message["status"]
+                if profile_id:
+                    message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_traced)
+        finally:
+            if elapsed_ms is None:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+            request_trace.reset(token)
+            if profiler:
+                profiles[profile_id] = profiler.stop()
+                while len(profiles) > PROFILE_STORE_SIZE:
+                    profiles.popitem(last=False)
+            if elapsed_ms - trace.upstream_ms >= SLOW_REQUEST_MS:
+                route = getattr(scope.get("route"), "path", "unmatched")
+                # Explains run after the response, in a clean context so they aren't traced themselves
+                run_in_background(
+                    record_slow_request(scope["method"], scope["path"], route, status, elapsed_ms, trace),
+                    context=contextvars.Context()
+                )
+
 # MongoDB connection
+# Writes and read-your-own-write lookups go through db (primary). Read-heavy endpoints that can
+# tolerate slightly stale data use read_db, which prefers secondaries within a staleness bound.
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '10000'))
+MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', '')
+MONGO_READ_PREFERENCE = os.environ.get('MONGO_READ_PREFERENCE', 'secondaryPreferred')
+MONGO_MAX_STALENESS_SECONDS = int(os.environ.get('MONGO_MAX_STALENESS_SECONDS', '90'))
+READ_PREFERENCES = {
+    "primary": read_preferences.Primary,
+    "primaryPreferred": read_preferences.PrimaryPreferred,
+    "secondary": read_preferences.Secondary,
+    "secondaryPreferred": read_preferences.SecondaryPreferred,
+    "nearest": read_preferences.Nearest,
+}
+
+def read_preference(mode: str, max_staleness: int):
+    if mode not in READ_PREFERENCES:
+        raise ValueError(f"MONGO_READ_PREFERENCE must be one of {', '.join(READ_PREFERENCES)}")
+    if mode == "primary":
+        return read_preferences.Primary()
+    # The server rejects staleness bounds under 90 seconds; -1 means unbounded
+    return READ_PREFERENCES[mode](max_staleness=max_staleness)
+
+def mongo_client_options() -> dict:
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "event_listeners": [mongo_command_metrics, mongo_pool_metrics],
+    }
+    if MONGO_COMPRESSORS:
+        options["compressors"] = MONGO_COMPRESSORS
+    return options
+
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, **mongo_client_options())
 db = client[os.environ['DB_NAME']]
+read_db = client.get_database(
+    os.environ['DB_NAME'],
+    read_preference=read_preference(MONGO_READ_PREFERENCE, MONGO_MAX_STALENESS_SECONDS)
+)
 
 # Create the main app without a prefix
 app = FastAPI()
@@ -72,6 +523,16 @@ class Workout(BaseModel):
     notes: Optional[str] = ""
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class NewRecord(BaseModel):
+    exercise_id: str
+    record: str  # max_weight, max_volume, longest_duration or max_reps_at_weight
+    value: float
+    previous: Optional[float] = None
+    weight: Optional[float] = None  # only for max_reps_at_weight
+
+class WorkoutWithRecords(Workout):
+    new_records: List[NewRecord] = []
+
 class Progress(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
@@ -81,12 +542,27 @@ class Progress(BaseModel):
     measurements: Optional[dict] = {}
     notes: Optional[str] = ""
     
-class AIConversation(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+class ProgressRollup(BaseModel):
+    date: datetime
+    resolution: str
+    count: int
+    weight: Optional[float] = None
+    weight_min: Optional[float] = None
+    weight_max: Optional[float] = None
+    body_fat: Optional[float] = None
+    body_fat_min: Optional[float] = None
+    body_fat_max: Optional[float] = None
+    measurements: Optional[dict] = {}
+    
+class AIConversationBucket(BaseModel):
+    id: str  # session_id:seq, see history_bucket_id
     user_id: str
     session_id: str
-    messages: List[dict]
+    seq: int
+    count: int = 0  # messages held, capped at AI_HISTORY_BUCKET_MESSAGES
+    messages: List[dict] = []
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class WorkoutCreate(BaseModel):
     name: str
@@ -99,15 +575,268 @@ class ProgressCreate(BaseModel):
     measurements: Optional[dict] = {}
     notes: Optional[str] = ""
 
+class WorkoutImport(WorkoutCreate):
+    date: Optional[datetime] = None
+    duration: Optional[int] = 0
+    idempotency_key: Optional[str] = None
+
+class ProgressImport(ProgressCreate):
+    date: Optional[datetime] = None
+    idempotency_key: Optional[str] = None
+
 class AIQuestion(BaseModel):
     question: str
     context: Optional[dict] = {}
+    use_cache: Optional[bool] = True
+
+def as_utc(value: datetime) -> datetime:
+    # Mongo hands datetimes back naive, but they are always stored in UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+# Shared state
+# Anything several uvicorn workers must agree on (session invalidations, rate-limit counters, cached
+# AI answers) goes through one backend. "memory" keeps it in this process, which is only correct for
+# a single worker; "mongo" keeps it in the database we already have, with no extra services.
+# Keys expire after their ttl; publish() reaches subscribers on every worker, this one included.
+SHARED_STATE_BACKEND = os.environ.get('SHARED_STATE_BACKEND', 'memory')
+SHARED_STATE_MEMORY_SIZE = int(os.environ.get('SHARED_STATE_MEMORY_SIZE', '100000'))
+SHARED_STATE_EVENTS_SIZE_BYTES = int(os.environ.get('SHARED_STATE_EVENTS_SIZE_BYTES', str(8 * 1024 * 1024)))
+SHARED_STATE_POLL_SECONDS = float(os.environ.get('SHARED_STATE_POLL_SECONDS', '1'))
+
+class SharedState(abc.ABC):
+    """Expiring keys, counters and broadcast messages shared by every worker."""
+
+    def __init__(self):
+        self._subscribers = {}
+
+    def subscribe(self, channel: str, callback):
+        self._subscribers.setdefault(channel, []).append(callback)
+
+    def _deliver(self, channel: str, message: dict):
+        for callback in self._subscribers.get(channel, []):
+            try:
+                callback(message)
+            except Exception as e:
+                logger.warning(f"Subscriber to {channel} failed: {e}")
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    @abc.abstractmethod
+    async def get(self, key: str):
+        ...
+
+    @abc.abstractmethod
+    async def set(self, key: str, value, ttl: float):
+        ...
+
+    @abc.abstractmethod
+    async def incr(self, key: str, ttl: float) -> int:
+        """Increment a counter that starts at 1 and lives ttl seconds from its first increment."""
+
+    @abc.abstractmethod
+    async def publish(self, channel: str, message: dict):
+        ...
+
+class MemorySharedState(SharedState):
+    def __init__(self, maxsize: int):
+        super().__init__()
+        self._cache = TLRUCache(maxsize=maxsize, ttu=lambda key, entry, now: entry[1], timer=time.time)
+
+    async def get(self, key: str):
+        entry = self._cache.get(key)
+        return entry[0] if entry is not None else None
+
+    async def set(self, key: str, value, ttl: float):
+        self._cache[key] = (value, time.time() + ttl)
+
+    async def incr(self, key: str, ttl: float) -> int:
+        value, expires_at = self._cache.get(key, (0, time.time() + ttl))
+        self._cache[key] = (value + 1, expires_at)
+        return value + 1
+
+    async def publish(self, channel: str, message: dict):
+        self._deliver(channel, message)
+
+class MongoSharedState(SharedState):
+    """Keys live in shared_state (TTL-indexed); messages go through the capped shared_events collection,
+    followed with a tailable cursor, or by polling where tailable cursors aren't available."""
+
+    def __init__(self, events_size: int, poll_seconds: float):
+        super().__init__()
+        self.events_size = events_size
+        self.poll_seconds = poll_seconds
+        self.mode = "tailable"
+        self.worker_id = uuid.uuid4().hex
+        self._seen = TTLCache(maxsize=10000, ttl=300)
+        self._listener = None
+
+    async def start(self):
+        try:
+            await db.create_collection("shared_events", capped=True, size=self.events_size)
+        except CollectionInvalid:
+            pass  # another worker created it first
+        except Exception as e:
+            logger.warning(f"Capped shared_events collection unavailable, polling instead: {e}")
+            self.mode = "polling"
+            # Without a cap the collection would only grow; let old events expire instead
+            await db.shared_events.create_index("created_at", name="created_at_ttl", expireAfterSeconds=3600)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+
+    async def get(self, key: str):
+        doc = await db.shared_state.find_one({"_id": key, "expires_at": {"$gt": datetime.now(timezone.utc)}})
+        return doc["value"] if doc else None
+
+    async def set(self, key: str, value, ttl: float):
+        await db.shared_state.update_one(
+            {"_id": key},
+            {"$set": {"value": value, "expires_at": datetime.now(timezone.utc) + timedelta(seconds=ttl)}},
+            upsert=True
+        )
+
+    async def incr(self, key: str, ttl: float) -> int:
+        # Keys are expected to name their window (e.g. rate limits), so an expired key is never reused
+        update = {
+            "$inc": {"value": 1},
+            "$setOnInsert": {"expires_at": datetime.now(timezone.utc) + timedelta(seconds=ttl)}
+        }
+        try:
+            doc = await db.shared_state.find_one_and_update(
+                {"_id": key}, update, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Lost an upsert race with another worker; the document exists now
+            doc = await db.shared_state.find_one_and_update({"_id": key}, update, return_document=ReturnDocument.AFTER)
+        return doc["value"]
+
+    async def publish(self, channel: str, message: dict):
+        self._deliver(channel, message)
+        await db.shared_events.insert_one({
+            "channel": channel,
+            "origin": self.worker_id,
+            "message": message,
+            "created_at": datetime.now(timezone.utc)
+        })
+
+    def _receive(self, event: dict):
+        if event["_id"] in self._seen:
+            return
+        self._seen[event["_id"]] = True
+        if event.get("origin") != self.worker_id:
+            self._deliver(event["channel"], event["message"])
+
+    async def _listen(self):
+        # Only events published after this worker started matter
+        since = ObjectId.from_datetime(datetime.now(timezone.utc))
+        while True:
+            # Ids from different workers aren't strictly ordered, so look back a little and dedupe
+            query = {"_id": {"$gte": ObjectId.from_datetime(since.generation_time - timedelta(seconds=5))}}
+            try:
+                if self.mode == "tailable":
+                    cursor = db.shared_events.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+                    while cursor.alive:
+                        async for event in cursor:
+                            self._receive(event)
+                            since = max(since, event["_id"])
+                else:
+                    async for event in db.shared_events.find(query).sort("_id", 1):
+                        self._receive(event)
+                        since = max(since, event["_id"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.mode == "tailable":
+                    logger.warning(f"Tailing shared_events failed, polling instead: {e}")
+                    self.mode = "polling"
+                else:
+                    logger.warning(f"Polling shared_events failed: {e}")
+            await asyncio.sleep(self.poll_seconds)
+
+def create_shared_state() -> SharedState:
+    if SHARED_STATE_BACKEND == "memory":
+        return MemorySharedState(SHARED_STATE_MEMORY_SIZE)
+    if SHARED_STATE_BACKEND == "mongo":
+        return MongoSharedState(SHARED_STATE_EVENTS_SIZE_BYTES, SHARED_STATE_POLL_SECONDS)
+    raise ValueError("SHARED_STATE_BACKEND must be memory or mongo")
+
+shared_state = create_shared_state()
+
+# Session cache
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', '10000'))
+SESSION_CACHE_TTL_SECONDS = int(os.environ.get('SESSION_CACHE_TTL_SECONDS', '300'))
+
+class SessionCache:
+    """LRU cache of session token -> User whose entries never outlive the session itself."""
+
+    def __init__(self, maxsize: int, ttl: int):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._cache = TLRUCache(maxsize=maxsize, ttu=self._time_to_use, timer=time.time)
+
+    def _time_to_use(self, token, entry, now):
+        return min(now + self.ttl, entry[1])
+
+    def get(self, session_token: str) -> Optional["User"]:
+        entry = self._cache.get(session_token)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def set(self, session_token: str, user: "User", expires_at: datetime):
+        self._cache[session_token] = (user, as_utc(expires_at).timestamp())
+
+    def invalidate(self, session_token: str):
+        self._cache.pop(session_token, None)
+
+    def invalidate_user(self, user_id: str):
+        for session_token in list(self._cache):
+            entry = self._cache.get(session_token)
+            if entry is not None and entry[0].id == user_id:
+                self._cache.pop(session_token, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._cache),
+            "maxsize": self._cache.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+session_cache = SessionCache(SESSION_CACHE_SIZE, SESSION_CACHE_TTL_SECONDS)
+
+def apply_session_invalidation(message: dict):
+    if message.get("session_token"):
+        session_cache.invalidate(message["session_token"])
+    if message.get("user_id"):
+        session_cache.invalidate_user(message["user_id"])
+
+shared_state.subscribe("sessions", apply_session_invalidation)
+
+async def invalidate_sessions(session_token: Optional[str] = None, user_id: Optional[str] = None):
+    """Drop cached sessions on every worker, by token or for all of a user's sessions."""
+    await shared_state.publish("sessions", {"session_token": session_token, "user_id": user_id})
 
 # Helper function to get current user from session
 async def get_current_user(session_token: Optional[str] = Cookie(None)):
     if not session_token:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
+    cached_user = session_cache.get(session_token)
+    if cached_user:
+        return cached_user
+    
     # Check if session exists and is valid
     session = await db.user_sessions.find_one({
         "session_token": session_token,
@@ -122,7 +851,9 @@ async def get_current_user(session_token: Optional[str] = Cookie(None)):
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    return User(**user)
+    user = User(**user)
+    session_cache.set(session_token, user, session["expires_at"])
+    return user
 
 # Initialize exercise database
 async def initialize_exercises():
@@ -180,6 +911,1181 @@ async def initialize_exercises():
     
     await db.exercises.insert_many(sample_exercises)
 
+# Exercise catalog
+# The catalog is small and changes rarely, so it is served from memory and reloaded periodically.
+EXERCISE_CATALOG_REFRESH_SECONDS = int(os.environ.get('EXERCISE_CATALOG_REFRESH_SECONDS', '300'))
+EXERCISE_CACHE_MAX_AGE_SECONDS = int(os.environ.get('EXERCISE_CACHE_MAX_AGE_SECONDS', '300'))
+
+SEARCH_FIELD_WEIGHTS = {"name": 3.0, "muscle_groups": 2.0, "equipment": 2.0, "instructions": 1.0}
+SEARCH_MATCH_WEIGHTS = {"exact": 1.0, "prefix": 0.7, "typo": 0.5}
+SEARCH_TYPO_MIN_LENGTH = 4
+
+def search_tokens(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+def single_deletes(term: str) -> set:
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+def within_one_edit(a: str, b: str) -> bool:
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    for i in range(len(a)):
+        if a[i] != b[i]:
+            if len(a) == len(b):
+                # substitution or adjacent transposition
+                return a[i + 1:] == b[i + 1:] or (a[i] == b[i + 1] and a[i + 1] == b[i] and a[i + 2:] == b[i + 2:])
+            return a[i:] == b[i + 1:]
+    return True
+
+class ExerciseSearchIndex:
+    """Inverted index over exercise text with prefix and one-typo matching.
+
+    Terms are kept in a sorted vocabulary for prefix ranges and in a deletion map
+    (every term under itself and its single-character deletions) so typo candidates
+    are found with a few dictionary lookups instead of a vocabulary scan.
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.doc_terms = {}
+        self.vocabulary = []
+        self.deletions = {}
+
+    def _add_term(self, term: str):
+        bisect.insort(self.vocabulary, term)
+        for key in single_deletes(term) | {term}:
+            self.deletions.setdefault(key, set()).add(term)
+
+    def _drop_term(self, term: str):
+        del self.vocabulary[bisect.bisect_left(self.vocabulary, term)]
+        for key in single_deletes(term) | {term}:
+            terms = self.deletions[key]
+            terms.discard(term)
+            if not terms:
+                del self.deletions[key]
+
+    def add(self, exercise: Exercise):
+        self.remove(exercise.id)
+        fields = {
+            "name": exercise.name,
+            "muscle_groups": " ".join(exercise.muscle_groups),
+            "equipment": exercise.equipment or "",
+            "instructions": exercise.instructions,
+        }
+        weights = {}
+        for field, text in fields.items():
+            for term in search_tokens(text):
+                weights[term] = max(weights.get(term, 0.0), SEARCH_FIELD_WEIGHTS[field])
+        for term, weight in weights.items():
+            if term not in self.postings:
+                self.postings[term] = {}
+                self._add_term(term)
+            self.postings[term][exercise.id] = weight
+        self.doc_terms[exercise.id] = set(weights)
+
+    def remove(self, exercise_id: str):
+        for term in self.doc_terms.pop(exercise_id, ()):
+            posting = self.postings[term]
+            posting.pop(exercise_id, None)
+            if not posting:
+                del self.postings[term]
+                self._drop_term(term)
+
+    def _matching_terms(self, token: str) -> dict:
+        matches = {}
+        if len(token) >= SEARCH_TYPO_MIN_LENGTH:
+            candidates = set()
+            for key in single_deletes(token) | {token}:
+                candidates |= self.deletions.get(key, set())
+            for term in candidates:
+                if within_one_edit(token, term):
+                    matches[term] = SEARCH_MATCH_WEIGHTS["typo"]
+        start = bisect.bisect_left(self.vocabulary, token)
+        for term in itertools.takewhile(lambda t: t.startswith(token), self.vocabulary[start:]):
+            matches[term] = SEARCH_MATCH_WEIGHTS["prefix"]
+        if token in self.postings:
+            matches[token] = SEARCH_MATCH_WEIGHTS["exact"]
+        return matches
+
+    def search(self, query: str) -> dict:
+        """Score exercises matching every query token; returns {exercise_id: score}."""
+        scores = None
+        for token in dict.fromkeys(search_tokens(query)):
+            token_scores = {}
+            for term, match_weight in self._matching_terms(token).items():
+                for exercise_id, field_weight in self.postings[term].items():
+                    score = match_weight * field_weight
+                    if score > token_scores.get(exercise_id, 0.0):
+                        token_scores[exercise_id] = score
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {i: scores[i] + token_scores[i] for i in scores.keys() & token_scores.keys()}
+            if not scores:
+                break
+        return scores or {}
+
+class ExerciseCatalog:
+    """In-memory exercises with lookups by id, category, difficulty, muscle group and equipment."""
+
+    def __init__(self):
+        self.exercises: List[Exercise] = []
+        self.documents = {}
+        self.by_id = {}
+        self.by_category = {}
+        self.by_difficulty = {}
+        self.by_muscle_group = {}
+        self.by_equipment = {}
+        self.search_index = ExerciseSearchIndex()
+        self.etag = None
+
+    async def refresh(self) -> bool:
+        docs = await read_db.exercises.find({}, {"_id": 0}).to_list(length=None)
+        return self.load(docs)
+
+    def load(self, docs: List[dict]) -> bool:
+        """Rebuild the lookups from docs; returns False when nothing changed."""
+        digest = hashlib.sha256(json.dumps(docs, sort_keys=True, default=str).encode()).hexdigest()[:20]
+        etag = f'"{digest}"'
+        if etag == self.etag:
+            return False
+        
+        exercises = [Exercise(**doc) for doc in docs]
+        by_category, by_difficulty, by_muscle_group, by_equipment = {}, {}, {}, {}
+        for exercise in exercises:
+            by_category.setdefault(exercise.category, set()).add(exercise.id)
+            by_difficulty.setdefault(exercise.difficulty, set()).add(exercise.id)
+            for muscle_group in exercise.muscle_groups:
+                by_muscle_group.setdefault(muscle_group, set()).add(exercise.id)
+            if exercise.equipment:
+                by_equipment.setdefault(exercise.equipment, set()).add(exercise.id)
+        
+        # Only reindex the exercises that were added, edited or removed
+        previous = self.by_id
+        by_id = {exercise.id: exercise for exercise in exercises}
+        for exercise in exercises:
+            if previous.get(exercise.id) != exercise:
+                self.search_index.add(exercise)
+        for exercise_id in previous.keys() - by_id.keys():
+            self.search_index.remove(exercise_id)
+        
+        self.exercises = exercises
+        self.documents = {exercise.id: exercise.dict() for exercise in exercises}
+        self.by_id = by_id
+        self.by_category = by_category
+        self.by_difficulty = by_difficulty
+        self.by_muscle_group = by_muscle_group
+        self.by_equipment = by_equipment
+        self.etag = etag
+        return True
+
+    def matching_ids(self, category: Optional[str] = None, difficulty: Optional[str] = None,
+                     muscle_group: Optional[str] = None, equipment: Optional[str] = None) -> Optional[set]:
+        """Ids passing every given filter, or None when no filter was given."""
+        ids = None
+        for lookup, value in ((self.by_category, category),
+                              (self.by_difficulty, difficulty),
+                              (self.by_muscle_group, muscle_group),
+                              (self.by_equipment, equipment)):
+            if value:
+                matches = lookup.get(value, set())
+                ids = matches if ids is None else ids & matches
+        return ids
+
+    def filter(self, category: Optional[str] = None, difficulty: Optional[str] = None,
+               muscle_group: Optional[str] = None, equipment: Optional[str] = None) -> List[Exercise]:
+        ids = self.matching_ids(category, difficulty, muscle_group, equipment)
+        if ids is None:
+            return self.exercises
+        return [exercise for exercise in self.exercises if exercise.id in ids]
+
+    def search(self, query: str, category: Optional[str] = None, difficulty: Optional[str] = None,
+               muscle_group: Optional[str] = None, equipment: Optional[str] = None, limit: int = 20) -> dict:
+        ids = self.matching_ids(category, difficulty, muscle_group, equipment)
+        if search_tokens(query):
+            scores = self.search_index.search(query)
+            if ids is not None:
+                scores = {i: score for i, score in scores.items() if i in ids}
+        else:
+            scores = {i: 0.0 for i in (self.by_id if ids is None else ids)}
+        
+        matches = sorted((self.by_id[i] for i in scores), key=lambda e: (-scores[e.id], e.name, e.id))
+        facets = {"category": {}, "difficulty": {}, "muscle_groups": {}, "equipment": {}}
+        for exercise in matches:
+            facets["category"][exercise.category] = facets["category"].get(exercise.category, 0) + 1
+            facets["difficulty"][exercise.difficulty] = facets["difficulty"].get(exercise.difficulty, 0) + 1
+            for muscle_group in exercise.muscle_groups:
+                facets["muscle_groups"][muscle_group] = facets["muscle_groups"].get(muscle_group, 0) + 1
+            if exercise.equipment:
+                facets["equipment"][exercise.equipment] = facets["equipment"].get(exercise.equipment, 0) + 1
+        
+        return {"total": len(matches), "results": matches[:limit], "facets": facets}
+
+exercise_catalog = ExerciseCatalog()
+catalog_refresh_task: Optional[asyncio.Task] = None
+
+async def refresh_exercise_catalog_periodically():
+    while True:
+        await asyncio.sleep(EXERCISE_CATALOG_REFRESH_SECONDS)
+        try:
+            if await exercise_catalog.refresh():
+                logger.info(f"Exercise catalog reloaded ({len(exercise_catalog.exercises)} exercises)")
+        except Exception as e:
+            logger.warning(f"Exercise catalog refresh failed: {e}")
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    if not if_none_match or not etag:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+# Index management
+# Every index the API relies on, per collection. Names are fixed so that
+# ensure_indexes can diff them against what is actually deployed.
+MANAGED_INDEXES = {
+    "users": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email"),
+    ],
+    "user_sessions": [
+        IndexModel([("session_token", ASCENDING), ("expires_at", ASCENDING)], name="session_token_expires_at"),
+        # Mongo drops sessions on its own once expires_at has passed
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "workouts": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("date", DESCENDING), ("id", DESCENDING)], name="user_id_date"),
+    ],
+    "progress": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("date", DESCENDING), ("id", DESCENDING)], name="user_id_date"),
+    ],
+    "exercises": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("category", ASCENDING), ("difficulty", ASCENDING)], name="category_difficulty"),
+    ],
+    "ai_conversations": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_id_created_at"),
+    ],
+    "ai_conversation_buckets": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("session_id", ASCENDING), ("seq", DESCENDING)], name="session_id_seq"),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_id_created_at"),
+    ],
+    "user_stats": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+    "ai_sessions": [
+        IndexModel([("session_id", ASCENDING)], name="session_id_unique", unique=True),
+    ],
+    "shared_state": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "locks": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "progress_rollups": [
+        IndexModel(
+            [("user_id", ASCENDING), ("resolution", ASCENDING), ("bucket", DESCENDING)],
+            name="user_id_resolution_bucket_unique",
+            unique=True
+        ),
+    ],
+    "personal_records": [
+        IndexModel([("user_id", ASCENDING), ("exercise_id", ASCENDING)], name="user_id_exercise_id_unique", unique=True),
+    ],
+}
+
+INDEX_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+def _index_matches(existing: dict, spec: dict) -> bool:
+    if list(existing["key"]) != list(spec["key"].items()):
+        return False
+    return all(existing.get(option) == spec.get(option) for option in INDEX_OPTIONS)
+
+async def ensure_indexes():
+    """Create missing managed indexes and rebuild the ones whose definition changed."""
+    changes = {}
+    for collection_name, models in MANAGED_INDEXES.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        created = []
+        for model in models:
+            spec = model.document
+            current = existing.get(spec["name"])
+            if current is not None and _index_matches(current, spec):
+                continue
+            try:
+                if current is not None:
+                    await collection.drop_index(spec["name"])
+                await collection.create_indexes([model])
+                created.append(spec["name"])
+            except OperationFailure as e:
+                logger.warning(f"Could not build index {collection_name}.{spec['name']}: {e}")
+        if created:
+            changes[collection_name] = created
+    return changes
+
+async def index_report():
+    """Report managed indexes that are missing and indexes that have never served a query."""
+    report = {}
+    for collection_name, models in MANAGED_INDEXES.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        try:
+            stats = await collection.aggregate([{"$indexStats": {}}]).to_list(length=None)
+        except OperationFailure:
+            stats = []
+        declared = {model.document["name"] for model in models}
+        report[collection_name] = {
+            "missing": sorted(declared - set(existing)),
+            "unmanaged": sorted(set(existing) - declared - {"_id_"}),
+            "unused": sorted(
+                s["name"] for s in stats
+                if s["name"] != "_id_" and s.get("accesses", {}).get("ops", 0) == 0
+            ),
+        }
+    return report
+
+# Maintenance locks
+# Backfills and migrations are started by every uvicorn worker; a lock document lets exactly one of
+# them run. Locks expire, so a worker that dies mid-job does not block the next attempt forever.
+MAINTENANCE_LOCK_TTL_SECONDS = int(os.environ.get('MAINTENANCE_LOCK_TTL_SECONDS', '900'))
+LOCK_OWNER = uuid.uuid4().hex
+
+@asynccontextmanager
+async def maintenance_lock(name: str):
+    """Yield True while this worker holds the named lock, False if another worker has it."""
+    now = datetime.now(timezone.utc)
+    try:
+        # A live lock fails the filter, so the upsert collides with it on _id
+        await db.locks.update_one(
+            {"_id": name, "expires_at": {"$lt": now}},
+            {"$set": {"owner": LOCK_OWNER, "expires_at": now + timedelta(seconds=MAINTENANCE_LOCK_TTL_SECONDS)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        await db.locks.delete_one({"_id": name, "owner": LOCK_OWNER})
+
+# Admin-only endpoints are disabled unless ADMIN_TOKEN is configured
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    admin_token = os.environ.get('ADMIN_TOKEN')
+    if not admin_token or x_admin_token != admin_token:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+# Outbound HTTP client, shared so upstream calls reuse pooled keep-alive connections
+AUTH_SESSION_DATA_URL = os.environ.get(
+    'AUTH_SESSION_DATA_URL',
+    "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data"
+)
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.environ.get('HTTP_CONNECT_TIMEOUT_SECONDS', '5'))
+HTTP_TIMEOUT_SECONDS = float(os.environ.get('HTTP_TIMEOUT_SECONDS', '10'))
+HTTP_MAX_CONNECTIONS = int(os.environ.get('HTTP_MAX_CONNECTIONS', '100'))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get('HTTP_MAX_KEEPALIVE_CONNECTIONS', '20'))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.environ.get('HTTP_KEEPALIVE_EXPIRY_SECONDS', '30'))
+HTTP_RETRY_ATTEMPTS = int(os.environ.get('HTTP_RETRY_ATTEMPTS', '3'))
+HTTP_RETRY_BACKOFF_SECONDS = float(os.environ.get('HTTP_RETRY_BACKOFF_SECONDS', '0.2'))
+
+http_client: Optional[httpx.AsyncClient] = None
+
+class UpstreamServerError(Exception):
+    pass
+
+def create_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS),
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+    )
+
+async def http_get(url: str, **kwargs) -> httpx.Response:
+    """GET through the shared client, retrying connection failures and 5xx answers with backoff."""
+    async for attempt in AsyncRetrying(
+        stop=stop_after_attempt(HTTP_RETRY_ATTEMPTS),
+        wait=wait_exponential(multiplier=HTTP_RETRY_BACKOFF_SECONDS, max=5),
+        retry=retry_if_exception_type((httpx.TransportError, UpstreamServerError)),
+        reraise=True,
+    ):
+        with attempt:
+            response = await http_client.get(url, **kwargs)
+            if response.status_code >= 500:
+                raise UpstreamServerError(f"{url} answered {response.status_code}")
+    return response
+
+# Background writes
+# Derived data (dashboard stats, rollups, conversation logs) is written off the request path.
+# Personal records are not: the response reports which records a workout broke, and only the
+# atomic $max that raises them can tell. Requests enqueue write models and return once their
+# primary write is done; workers coalesce whatever is waiting into one unordered bulk_write per
+# collection. Queued writes must tolerate being applied late and in any order, and each one is
+# guarded on the id of what it records so that applying it twice is a no-op; that is what makes
+# it safe to re-send a batch after a connection failure, when we can't know what landed. Write
+# errors are retried only when their code is transient. Jobs can name an owner (a user id), and a
+# collection can register an on_dropped handler that is told whose writes were given up on.
+WRITE_QUEUE_MAX_SIZE = int(os.environ.get('WRITE_QUEUE_MAX_SIZE', '10000'))
+WRITE_QUEUE_WORKERS = int(os.environ.get('WRITE_QUEUE_WORKERS', '2'))
+WRITE_QUEUE_BATCH_SIZE = int(os.environ.get('WRITE_QUEUE_BATCH_SIZE', '500'))
+WRITE_QUEUE_RETRY_ATTEMPTS = int(os.environ.get('WRITE_QUEUE_RETRY_ATTEMPTS', '5'))
+WRITE_QUEUE_RETRY_BACKOFF_SECONDS = float(os.environ.get('WRITE_QUEUE_RETRY_BACKOFF_SECONDS', '0.2'))
+WRITE_QUEUE_DRAIN_SECONDS = float(os.environ.get('WRITE_QUEUE_DRAIN_SECONDS', '10'))
+# Elections, shutdowns, network blips and write conflicts: the write did not happen and may succeed later
+TRANSIENT_WRITE_ERROR_CODES = {6, 7, 89, 91, 112, 189, 262, 9001, 10107, 11600, 11602, 13435, 13436}
+
+class WriteQueue:
+    """Bounded queue of follow-up writes, applied by a few workers in per-collection batches."""
+
+    def __init__(self, maxsize: int, workers: int, batch_size: int):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.on_dropped = {}  # collection -> async callback taking the owners of dropped writes
+        self._queue = asyncio.Queue(maxsize)
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def put(self, collection: str, operations: list, owner: Optional[str] = None):
+        """Queue writes for collection; waits for room when the queue is full."""
+        if operations:
+            await self._queue.put((collection, operations, owner))
+
+    async def join(self):
+        await self._queue.join()
+
+    async def drain(self, timeout: float):
+        """Finish what is queued (up to timeout), then stop the workers."""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Write queue drain timed out with {self._queue.qsize()} jobs left")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _work(self):
+        while True:
+            collection, operations, owner = await self._queue.get()
+            batches, taken, size = {}, 0, 0
+            while True:
+                batches.setdefault(collection, []).extend((op, owner) for op in operations)
+                taken += 1
+                size += len(operations)
+                if size >= self.batch_size or self._queue.empty():
+                    break
+                collection, operations, owner = self._queue.get_nowait()
+            try:
+                for collection, items in batches.items():
+                    dropped = await self._write(collection, [op for op, _ in items])
+                    owners = {items[index][1] for index in dropped} - {None}
+                    if owners and collection in self.on_dropped:
+                        try:
+                            await self.on_dropped[collection](owners)
+                        except Exception as e:
+                            logger.error(f"Could not recover from dropped writes to {collection}: {e}")
+            finally:
+                for _ in range(taken):
+                    self._queue.task_done()
+
+    async def _write(self, collection: str, operations: list) -> List[int]:
+        """Apply operations, retrying what may still succeed; returns the indexes of those given up on."""
+        pending = list(range(len(operations)))
+        dropped = []
+        duplicates = set()
+        try:
+            async for attempt in AsyncRetrying(
+                stop=stop_after_attempt(WRITE_QUEUE_RETRY_ATTEMPTS),
+                wait=wait_exponential(multiplier=WRITE_QUEUE_RETRY_BACKOFF_SECONDS, max=5),
+                retry=retry_if_exception_type((ConnectionFailure, BulkWriteError)),
+                reraise=True,
+            ):
+                with attempt:
+                    try:
+                        await db[collection].bulk_write([operations[index] for index in pending], ordered=False)
+                        pending = []
+                    except BulkWriteError as e:
+                        retry = []
+                        for error in e.details["writeErrors"]:
+                            index = pending[error["index"]]
+                            if error["code"] in TRANSIENT_WRITE_ERROR_CODES:
+                                retry.append(index)
+                            elif error["code"] == 11000:
+                                # A concurrent upsert may have created the document first, so try once
+                                # more; a second duplicate means the guard found the write already applied
+                                if index not in duplicates:
+                                    duplicates.add(index)
+                                    retry.append(index)
+                            else:
+                                dropped.append(index)
+                                logger.error(f"Dropped queued write to {collection}: {error.get('errmsg')}")
+                        pending = sorted(retry)
+                        if pending:
+                            raise
+        except Exception as e:
+            dropped += pending
+            logger.error(f"Dropped {len(pending)} queued writes to {collection}: {e}")
+        self.failed += len(dropped)
+        self.written += len(operations) - len(dropped)
+        self.batches += 1
+        return dropped
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "max_size": self._queue.maxsize,
+            "workers": self.workers,
+            "batches": self.batches,
+            "written": self.written,
+            "failed": self.failed,
+        }
+
+write_queue = WriteQueue(WRITE_QUEUE_MAX_SIZE, WRITE_QUEUE_WORKERS, WRITE_QUEUE_BATCH_SIZE)
+
+# Dashboard summary
+# One document per user, kept current by the write paths so the dashboard is a single point read.
+# recent_workout_dates is capped and only exists to derive the rolling "this week" count.
+# A rebuild counts every workout and records a snapshot point: workouts inserted before it are
+# counted, and for newer ones counted_ids lists those already in the total. Queued updates only
+# apply to workouts past the snapshot that aren't listed, so replays and rebuilds count them once.
+DASHBOARD_RECENT_WORKOUTS = 3
+STATS_RECENT_DATES_LIMIT = int(os.environ.get('STATS_RECENT_DATES_LIMIT', '100'))
+STATS_COUNTED_IDS_LIMIT = int(os.environ.get('STATS_COUNTED_IDS_LIMIT', '100'))
+STATS_SNAPSHOT_MARGIN = timedelta(minutes=1)  # far longer than an insert takes to land
+
+async def rebuild_user_stats(user_id: str) -> dict:
+    """Recompute a user's summary document from the workouts and progress collections."""
+    counted_since = ObjectId.from_datetime(datetime.now(timezone.utc) - STATS_SNAPSHOT_MARGIN)
+    facets = await db.workouts.aggregate([
+        {"$match": {"user_id": user_id}},
+        {"$sort": {"date": -1}},
+        {"$facet": {
+            "total": [{"$count": "count"}],
+            "recent_workouts": [{"$limit": DASHBOARD_RECENT_WORKOUTS}, {"$project": {"_id": 0}}],
+            "recent_dates": [{"$limit": STATS_RECENT_DATES_LIMIT}, {"$project": {"_id": 0, "date": 1}}],
+            "since_snapshot": [{"$match": {"_id": {"$gte": counted_since}}}, {"$project": {"_id": 0, "id": 1}}],
+        }},
+    ]).to_list(length=None)
+    facet = facets[0] if facets else {"total": [], "recent_workouts": [], "recent_dates": [], "since_snapshot": []}
+    latest_progress = await db.progress.find_one(
+        {"user_id": user_id},
+        {"_id": 0},
+        sort=[("date", -1)]
+    )
+    stats = {
+        "user_id": user_id,
+        "total_workouts": facet["total"][0]["count"] if facet["total"] else 0,
+        "recent_workouts": facet["recent_workouts"],
+        "recent_workout_dates": [w["date"] for w in facet["recent_dates"]],
+        "counted_since": counted_since,
+        "counted_ids": [w["id"] for w in facet["since_snapshot"]],
+        "latest_progress": latest_progress,
+        "updated_at": datetime.now(timezone.utc),
+    }
+    await db.user_stats.replace_one({"user_id": user_id}, stats, upsert=True)
+    return stats
+
+async def record_workout_in_stats(workout: dict, object_id: ObjectId):
+    # Users without a summary yet are skipped; the dashboard rebuilds it on first read
+    await write_queue.put("user_stats", [UpdateOne(
+        {
+            "user_id": workout["user_id"],
+            "counted_since": {"$not": {"$gt": object_id}},
+            "counted_ids": {"$ne": workout["id"]}
+        },
+        {
+            "$inc": {"total_workouts": 1},
+            "$push": {
+                "counted_ids": {"$each": [workout["id"]], "$slice": -STATS_COUNTED_IDS_LIMIT},
+                "recent_workouts": {
+                    "$each": [workout],
+                    "$sort": {"date": -1},
+                    "$slice": DASHBOARD_RECENT_WORKOUTS
+                },
+                "recent_workout_dates": {
+                    "$each": [workout["date"]],
+                    "$sort": -1,
+                    "$slice": STATS_RECENT_DATES_LIMIT
+                },
+            },
+            "$set": {"updated_at": datetime.now(timezone.utc)},
+        }
+    )], owner=workout["user_id"])
+
+async def record_progress_in_stats(progress: dict):
+    await write_queue.put("user_stats", [UpdateOne(
+        {
+            "user_id": progress["user_id"],
+            "$or": [
+                {"latest_progress": None},
+                {"latest_progress.date": {"$lte": progress["date"]}}
+            ]
+        },
+        {"$set": {"latest_progress": progress, "updated_at": datetime.now(timezone.utc)}}
+    )], owner=progress["user_id"])
+
+async def invalidate_user_stats(user_ids: set):
+    # A lost update would leave the summary wrong for good; without it the dashboard rebuilds it
+    await db.user_stats.delete_many({"user_id": {"$in": list(user_ids)}})
+
+write_queue.on_dropped["user_stats"] = invalidate_user_stats
+
+async def count_workouts_since(user_id: str, stats: dict, since: datetime) -> int:
+    dates = stats["recent_workout_dates"]
+    count = sum(1 for d in dates if as_utc(d) >= since)
+    if count == STATS_RECENT_DATES_LIMIT:
+        # Every remembered date falls in the window, so there may be more than we kept
+        return await read_db.workouts.count_documents({"user_id": user_id, "date": {"$gte": since}})
+    return count
+
+# Keyset pagination
+# Cursors are opaque to clients: base64 of the (date, id) of the last item on the page.
+# Pages are ordered by (date, id) descending, which the user_id_date indexes cover.
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', '1000'))
+PAGE_ORDER = [("date", DESCENDING), ("id", DESCENDING)]
+
+def encode_cursor(doc: dict) -> str:
+    payload = json.dumps({"date": as_utc(doc["date"]).isoformat(), "id": doc["id"]})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(payload["date"]), str(payload["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def after_cursor(query: dict, cursor: Optional[str]) -> dict:
+    if not cursor:
+        return query
+    date, doc_id = decode_cursor(cursor)
+    return {**query, "$or": [{"date": {"$lt": date}}, {"date": date, "id": {"$lt": doc_id}}]}
+
+async def fetch_page(collection, query: dict, cursor: Optional[str], limit: int):
+    """Fetch one page after cursor; returns the documents (without _id) and the page headers."""
+    docs = await collection.find(
+        after_cursor(query, cursor),
+        {"_id": 0}
+    ).sort(PAGE_ORDER).limit(limit + 1).to_list(length=None)
+    headers = {}
+    if len(docs) > limit:
+        docs = docs[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(docs[-1])
+    return docs, headers
+
+# History export
+# Documents are streamed straight off the cursor as NDJSON, one {"type", "data"} record per line,
+# so memory stays bounded by the batch size whatever the size of the account.
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '500'))
+EXPORT_SOURCES = [
+    ("workout", "workouts", "date"),
+    ("progress", "progress", "date"),
+    ("ai_conversation", "ai_conversation_buckets", "created_at"),
+]
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return as_utc(value).isoformat()
+    return str(value)
+
+async def export_lines(user_id: str):
+    for record_type, collection_name, sort_field in EXPORT_SOURCES:
+        cursor = db[collection_name].find(
+            {"user_id": user_id},
+            {"_id": 0},
+            batch_size=EXPORT_BATCH_SIZE
+        ).sort(sort_field, 1)
+        lines = []
+        async for doc in cursor:
+            lines.append(json.dumps({"type": record_type, "data": doc}, default=json_default))
+            if len(lines) >= EXPORT_BATCH_SIZE:
+                yield "\n".join(lines) + "\n"
+                lines = []
+        if lines:
+            yield "\n".join(lines) + "\n"
+
+async def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=31)  # 31 selects the gzip container
+    async for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+# Bulk ingestion
+# Items carrying an idempotency key get an id derived from it, so a retried batch
+# collides with the unique id index and the repeats are reported as duplicates.
+BULK_MAX_ITEMS = int(os.environ.get('BULK_MAX_ITEMS', '5000'))
+IMPORT_NAMESPACE = uuid.UUID("6f1c4f0e-3b9a-4c55-9a59-2f0d8b7f5e21")
+
+def import_id(user_id: str, kind: str, idempotency_key: Optional[str]) -> str:
+    if not idempotency_key:
+        return str(uuid.uuid4())
+    return str(uuid.uuid5(IMPORT_NAMESPACE, f"{user_id}:{kind}:{idempotency_key}"))
+
+async def bulk_insert(collection, items: List[dict], build_document):
+    """Validate and insert items with one unordered insert_many.
+
+    Returns the per-item outcome report and the documents that were actually created.
+    """
+    if len(items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_ITEMS} items per request")
+    
+    results = [None] * len(items)
+    documents = []
+    positions = []
+    for index, item in enumerate(items):
+        try:
+            document = build_document(item)
+        except (ValidationError, TypeError) as e:
+            results[index] = {"index": index, "status": "invalid", "error": str(e)}
+            continue
+        results[index] = {"index": index, "id": document["id"], "status": "created"}
+        documents.append(document)
+        positions.append(index)
+    
+    if documents:
+        try:
+            await collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details["writeErrors"]:
+                result = results[positions[error["index"]]]
+                if error["code"] == 11000:
+                    result["status"] = "duplicate"
+                else:
+                    result["status"] = "error"
+                    result["error"] = error.get("errmsg", "Write failed")
+    
+    summary = {"created": 0, "duplicate": 0, "invalid": 0, "error": 0}
+    for result in results:
+        summary[result["status"]] += 1
+    created = [doc for doc, index in zip(documents, positions) if results[index]["status"] == "created"]
+    for doc in created:
+        doc.pop("_id", None)
+    return {**summary, "results": results}, created
+
+# Analytics
+# Mongo does the grouping; NumPy only post-processes the small per-period series.
+ANALYTICS_PERIOD_FORMATS = {"day": "%Y-%m-%d", "week": "%G-W%V", "month": "%Y-%m"}
+ANALYTICS_MAX_DAYS = int(os.environ.get('ANALYTICS_MAX_DAYS', '3650'))
+
+def analytics_period_format(period: str) -> str:
+    if period not in ANALYTICS_PERIOD_FORMATS:
+        raise HTTPException(status_code=400, detail=f"period must be one of {', '.join(ANALYTICS_PERIOD_FORMATS)}")
+    return ANALYTICS_PERIOD_FORMATS[period]
+
+def exercise_sets_pipeline(user_id: str, days: int, exercise_id: Optional[str]) -> List[dict]:
+    start_date = datetime.now(timezone.utc) - timedelta(days=days)
+    pipeline = [
+        {"$match": {"user_id": user_id, "date": {"$gte": start_date}}},
+        {"$project": {"_id": 0, "date": 1, "exercises": 1}},
+        {"$unwind": "$exercises"},
+    ]
+    if exercise_id:
+        pipeline.append({"$match": {"exercises.exercise_id": exercise_id}})
+    return pipeline
+
+def rounded(values) -> list:
+    return [None if np.isnan(v) else round(float(v), 2) for v in values]
+
+def moving_average(values: np.ndarray, window: int) -> np.ndarray:
+    """Trailing mean over the last `window` samples, ignoring missing (NaN) ones."""
+    present = ~np.isnan(values)
+    sums = np.cumsum(np.where(present, values, 0.0))
+    counts = np.cumsum(present).astype(float)
+    sums[window:] = sums[window:] - sums[:-window].copy()
+    counts[window:] = counts[window:] - counts[:-window].copy()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+async def grouped_exercise_series(pipeline: List[dict]) -> List[dict]:
+    """Turn rows grouped by (exercise_id, period) into one columnar series per exercise."""
+    rows = await db.workouts.aggregate(pipeline + [
+        {"$sort": {"_id.exercise_id": 1, "_id.period": 1}}
+    ]).to_list(length=None)
+    names = await exercise_names({row["_id"]["exercise_id"] for row in rows})
+    series = {}
+    for row in rows:
+        exercise_id = row["_id"]["exercise_id"]
+        item = series.setdefault(exercise_id, {
+            "exercise_id": exercise_id,
+            "name": names.get(exercise_id),
+            "periods": [],
+            "rows": [],
+        })
+        item["periods"].append(row["_id"]["period"])
+        item["rows"].append(row)
+    return list(series.values())
+
+# Progress rollups
+# Per-user day/week/month buckets with counts, sums, minimums and maximums, so long-range
+# progress charts read a bounded number of documents instead of every raw entry. Each bucket lists
+# the entries it already counts, so an update that is applied twice only counts once.
+ROLLUP_RESOLUTIONS = ("day", "week", "month")
+ROLLUP_FIELDS = ("weight", "body_fat")
+
+def bucket_start(date: datetime, resolution: str) -> datetime:
+    day = as_utc(date).replace(hour=0, minute=0, second=0, microsecond=0)
+    if resolution == "week":
+        return day - timedelta(days=day.weekday())
+    if resolution == "month":
+        return day.replace(day=1)
+    return day
+
+def rollup_measurements(progress: dict) -> dict:
+    # Measurement names become field paths, so anything Mongo can't store as a key is skipped
+    return {
+        key: float(value)
+        for key, value in (progress.get("measurements") or {}).items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+        and "." not in key and not key.startswith("$")
+    }
+
+def rollup_update(progress: dict, resolution: str) -> UpdateOne:
+    increments = {"count": 1}
+    minimums, maximums = {}, {}
+    for field in ROLLUP_FIELDS:
+        value = progress.get(field)
+        if value is not None:
+            increments[f"{field}_count"] = 1
+            increments[f"{field}_sum"] = value
+            minimums[f"{field}_min"] = value
+            maximums[f"{field}_max"] = value
+    for key, value in rollup_measurements(progress).items():
+        increments[f"measurements.{key}.count"] = 1
+        increments[f"measurements.{key}.sum"] = value
+    
+    update = {"$inc": increments, "$push": {"entry_ids": progress["id"]}}
+    if minimums:
+        update["$min"] = minimums
+        update["$max"] = maximums
+    return UpdateOne(
+        {
+            "user_id": progress["user_id"],
+            "resolution": resolution,
+            "bucket": bucket_start(progress["date"], resolution),
+            "entry_ids": {"$ne": progress["id"]}
+        },
+        update,
+        upsert=True
+    )
+
+async def record_progress_in_rollups(entries: List[dict]):
+    await write_queue.put(
+        "progress_rollups",
+        [rollup_update(progress, resolution) for progress in entries for resolution in ROLLUP_RESOLUTIONS]
+    )
+
+def accumulate_rollup(buckets: dict, progress: dict):
+    for resolution in ROLLUP_RESOLUTIONS:
+        start = bucket_start(progress["date"], resolution)
+        bucket = buckets.setdefault((resolution, start), {
+            "user_id": progress["user_id"],
+            "resolution": resolution,
+            "bucket": start,
+            "count": 0,
+            "entry_ids": [],
+            "measurements": {},
+        })
+        bucket["count"] += 1
+        bucket["entry_ids"].append(progress["id"])
+        for field in ROLLUP_FIELDS:
+            value = progress.get(field)
+            if value is None:
+                continue
+            bucket[f"{field}_count"] = bucket.get(f"{field}_count", 0) + 1
+            bucket[f"{field}_sum"] = bucket.get(f"{field}_sum", 0) + value
+            bucket[f"{field}_min"] = min(bucket.get(f"{field}_min", value), value)
+            bucket[f"{field}_max"] = max(bucket.get(f"{field}_max", value), value)
+        for key, value in rollup_measurements(progress).items():
+            measurement = bucket["measurements"].setdefault(key, {"count": 0, "sum": 0.0})
+            measurement["count"] += 1
+            measurement["sum"] += value
+
+async def backfill_progress_rollups(user_id: Optional[str] = None) -> Optional[int]:
+    """Rebuild rollups from raw progress, one user at a time; returns the number of users rebuilt,
+    or None when another worker is already running a backfill."""
+    async with maintenance_lock("progress_rollups_backfill") as acquired:
+        if not acquired:
+            return None
+        # Buckets are replaced in place rather than deleted, so readers never see a gap. Entries
+        # newer than the snapshot may have been counted in a bucket we just replaced; they are
+        # re-applied afterwards through the guarded update, which skips buckets that count them
+        snapshot = ObjectId.from_datetime(datetime.now(timezone.utc) - timedelta(minutes=1))
+        projection = {"_id": 0, "id": 1, "user_id": 1, "date": 1, "weight": 1, "body_fat": 1, "measurements": 1}
+        query = {"user_id": user_id} if user_id else {}
+        cursor = db.progress.find(
+            {**query, "_id": {"$lt": snapshot}},
+            projection,
+            batch_size=EXPORT_BATCH_SIZE
+        ).sort("user_id", 1)
+        
+        async def flush(owner, buckets):
+            await db.progress_rollups.bulk_write([
+                ReplaceOne(
+                    {"user_id": owner, "resolution": bucket["resolution"], "bucket": bucket["bucket"]},
+                    bucket,
+                    upsert=True
+                )
+                for bucket in buckets.values()
+            ], ordered=False)
+        
+        users = 0
+        current_user_id, buckets = None, {}
+        async for progress in cursor:
+            if progress["user_id"] != current_user_id:
+                if current_user_id is not None:
+                    await flush(current_user_id, buckets)
+                    users += 1
+                current_user_id, buckets = progress["user_id"], {}
+            accumulate_rollup(buckets, progress)
+        if current_user_id is not None:
+            await flush(current_user_id, buckets)
+            users += 1
+        recent = await db.progress.find({**query, "_id": {"$gte": snapshot}}, projection).to_list(length=None)
+        if recent:
+            await record_progress_in_rollups(recent)
+        return users
+
+async def backfill_progress_rollups_if_empty():
+    try:
+        if await db.progress_rollups.find_one({}) or not await db.progress.find_one({}):
+            return
+        users = await backfill_progress_rollups()
+        if users is not None:
+            logger.info(f"Backfilled progress rollups for {users} users")
+    except Exception as e:
+        logger.warning(f"Progress rollup backfill failed: {e}")
+
+rollup_backfill_task: Optional[asyncio.Task] = None
+
+def pick_resolution(days: int) -> str:
+    if days <= 90:
+        return "raw"
+    if days <= 365:
+        return "day"
+    if days <= 5 * 365:
+        return "week"
+    return "month"
+
+def rollup_point(bucket: dict) -> dict:
+    point = {"date": bucket["bucket"], "resolution": bucket["resolution"], "count": bucket["count"]}
+    for field in ROLLUP_FIELDS:
+        count = bucket.get(f"{field}_count")
+        point[field] = bucket[f"{field}_sum"] / count if count else None
+        point[f"{field}_min"] = bucket.get(f"{field}_min")
+        point[f"{field}_max"] = bucket.get(f"{field}_max")
+    point["measurements"] = {
+        key: measurement["sum"] / measurement["count"]
+        for key, measurement in bucket.get("measurements", {}).items()
+        if measurement["count"]
+    }
+    return point
+
+# Personal records
+# One document per user and exercise holds the best values logged so far. Writes use $max, so
+# concurrent workouts can only ever raise a record, and the document from before the update tells
+# us which records a workout broke. Leaderboards across users are kept in memory as sorted lists.
+PERSONAL_RECORD_FIELDS = ("max_weight", "max_volume", "longest_duration")
+LEADERBOARD_REFRESH_SECONDS = int(os.environ.get('LEADERBOARD_REFRESH_SECONDS', '300'))
+LEADERBOARD_MAX_SIZE = 100
+
+def weight_key(weight: float) -> str:
+    # Field names can't contain dots, so reps at 102.5 kg are kept under "102_5"
+    return f"{weight:g}".replace(".", "_")
+
+def workout_bests(workouts: List[dict]) -> dict:
+    """Best values per exercise across the given workouts; volume is per workout, as in analytics."""
+    bests = {}
+    for workout in workouts:
+        volumes = {}
+        for entry in workout["exercises"]:
+            sets, reps, weight, duration = (entry.get(field) or 0 for field in ("sets", "reps", "weight", "duration"))
+            best = bests.setdefault(entry["exercise_id"], {
+                **{field: 0 for field in PERSONAL_RECORD_FIELDS},
+                "max_reps_at_weight": {}
+            })
+            if weight > 0 and reps > 0:
+                best["max_weight"] = max(best["max_weight"], weight)
+                key = weight_key(weight)
+                best["max_reps_at_weight"][key] = max(best["max_reps_at_weight"].get(key, 0), reps)
+            best["longest_duration"] = max(best["longest_duration"], duration)
+            volumes[entry["exercise_id"]] = volumes.get(entry["exercise_id"], 0) + sets * reps * weight
+        for exercise_id, volume in volumes.items():
+            bests[exercise_id]["max_volume"] = max(bests[exercise_id]["max_volume"], volume)
+    return bests
+
+class Leaderboard:
+    """Scores kept sorted highest first, like a sorted set: O(log n) rank lookups and top-K slices."""
+
+    def __init__(self):
+        self.scores = {}
+        self._ranked = []  # (-score, member)
+
+    def __len__(self) -> int:
+        return len(self._ranked)
+
+    def update(self, member: str, score: float):
+        """Raise member's score; lower scores are ignored, as records never go down."""
+        previous = self.scores.get(member)
+        if previous is not None:
+            if score <= previous:
+                return
+            del self._ranked[bisect.bisect_left(self._ranked, (-previous, member))]
+        self.scores[member] = score
+        bisect.insort(self._ranked, (-score, member))
+
+    def top(self, k: int) -> List[tuple]:
+        return [(member, -score) for score, member in self._ranked[:k]]
+
+    def rank(self, member: str) -> Optional[int]:
+        """1-based rank; members with equal scores share a rank."""
+        score = self.scores.get(member)
+        if score is None:
+            return None
+        return bisect.bisect_left(self._ranked, (-score,)) + 1
+
+class PersonalRecordBoards:
+    """One leaderboard per exercise and record field, rebuilt periodically from personal_records."""
+
+    def __init__(self):
+        self.boards = {}
+
+    def update(self, user_id: str, exercise_id: str, field: str, value: float):
+        self.boards.setdefault((exercise_id, field), Leaderboard()).update(user_id, value)
+
+    def get(self, exercise_id: str, field: str) -> Optional[Leaderboard]:
+        return self.boards.get((exercise_id, field))
+
+    async def refresh(self):
+        # Other workers write records too, so reload rather than trusting local updates alone
+        boards = {}
+        projection = {"_id": 0, "user_id": 1, "exercise_id": 1, **{field: 1 for field in PERSONAL_RECORD_FIELDS}}
+        async for record in read_db.personal_records.find({}, projection, batch_size=EXPORT_BATCH_SIZE):
+            for field in PERSONAL_RECORD_FIELDS:
+                if record.get(field):
+                    boards.setdefault((record["exercise_id"], field), Leaderboard()).update(record["user_id"], record[field])
+        self.boards = boards
+
+personal_record_boards = PersonalRecordBoards()
+
+def record_maximums(best: dict) -> dict:
+    """The $max document that raises a record document to best."""
+    maximums = {field: best[field] for field in PERSONAL_RECORD_FIELDS if best[field] > 0}
+    maximums.update({f"max_reps_at_weight.{key}": reps for key, reps in best["max_reps_at_weight"].items()})
+    return maximums
+
+async def record_personal_records(user_id: str, workouts: List[dict]) -> List[dict]:
+    """Fold workouts into the user's records; returns the records they broke."""
+    now = datetime.now(timezone.utc)
+    
+    async def update(exercise_id: str, best: dict) -> List[dict]:
+        maximums = record_maximums(best)
+        if not maximums:
+            return []
+        before = await db.personal_records.find_one_and_update(
+            {"user_id": user_id, "exercise_id": exercise_id},
+            {"$max": maximums, "$set": {"updated_at": now}},
+            projection={"_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        ) or {}
+        
+        new_records = []
+        for field in PERSONAL_RECORD_FIELDS:
+            if field in maximums and maximums[field] > (before.get(field) or 0):
+                personal_record_boards.update(user_id, exercise_id, field, maximums[field])
+                new_records.append({
+                    "exercise_id": exercise_id,
+                    "record": field,
+                    "value": maximums[field],
+                    "previous": before.get(field)
+                })
+        reps_before = before.get("max_reps_at_weight", {})
+        for key, reps in best["max_reps_at_weight"].items():
+            if reps > reps_before.get(key, 0):
+                new_records.append({
+                    "exercise_id": exercise_id,
+                    "record": "max_reps_at_weight",
+                    "weight": float(key.replace("_", ".")),
+                    "value": reps,
+                    "previous": reps_before.get(key)
+                })
+        return new_records
+    
+    results = await asyncio.gather(*(update(exercise_id, best) for exercise_id, best in workout_bests(workouts).items()))
+    return [record for records in results for record in records]
+
+async def backfill_personal_records(user_id: Optional[str] = None) -> Optional[int]:
+    """Fold workout history into records, one user at a time; returns the number of users processed,
+    or None when another worker is already running a backfill."""
+    async with maintenance_lock("personal_records_backfill") as acquired:
+        if not acquired:
+            return None
+        query = {"user_id": user_id} if user_id else {}
+        cursor = db.workouts.find(
+            query, {"_id": 0, "user_id": 1, "exercises": 1}, batch_size=EXPORT_BATCH_SIZE
+        ).sort("user_id", 1)
+        
+        async def flush(owner, workouts):
+            # $max upserts, like the live path, so workouts logged meanwhile can't be lost or collide
+            now = datetime.now(timezone.utc)
+            updates = [
+                UpdateOne(
+                    {"user_id": owner, "exercise_id": exercise_id},
+                    {"$max": maximums, "$set": {"updated_at": now}},
+                    upsert=True
+                )
+                for exercise_id, best in workout_bests(workouts).items()
+                if (maximums := record_maximums(best))
+            ]
+            if updates:
+                await db.personal_records.bulk_write(updates, ordered=False)
+        
+        users = 0
+        current_user_id, workouts = None, []
+        async for workout in cursor:
+            if workout["user_id"] != current_user_id:
+                if current_user_id is not None:
+                    await flush(current_user_id, workouts)
+                    users += 1
+                current_user_id, workouts = workout["user_id"], []
+            workouts.append(workout)
+        if current_user_id is not None:
+            await flush(current_user_id, workouts)
+            users += 1
+        return users
+
+async def maintain_personal_record_boards():
+    try:
+        if not await db.personal_records.find_one({}) and await db.workouts.find_one({}):
+            users = await backfill_personal_records()
+            if users is not None:
+                logger.info(f"Backfilled personal records for {users} users")
+    except Exception as e:
+        logger.warning(f"Personal record backfill failed: {e}")
+    while True:
+        try:
+            await personal_record_boards.refresh()
+        except Exception as e:
+            logger.warning(f"Leaderboard refresh failed: {e}")
+        await asyncio.sleep(LEADERBOARD_REFRESH_SECONDS)
+
+leaderboard_task: Optional[asyncio.Task] = None
+
 # Authentication routes
 @api_router.get("/auth/session-data")
 async def get_session_data(x_session_id: str = None):
@@ -188,8 +2094,8 @@ async def get_session_data(x_session_id: str = None):
     
     # Call Emergent auth service
     try:
-        response = requests.get(
-            "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
+        response = await http_get(
+            AUTH_SESSION_DATA_URL,
             headers={"X-Session-ID": x_session_id}
         )
         
@@ -236,22 +2142,37 @@ async def get_session_data(x_session_id: str = None):
 async def logout(current_user: User = Depends(get_current_user), session_token: Optional[str] = Cookie(None)):
     if session_token:
         await db.user_sessions.delete_one({"session_token": session_token})
+        await invalidate_sessions(session_token=session_token)
     return {"message": "Logged out successfully"}
 
 # Exercise routes
 @api_router.get("/exercises", response_model=List[Exercise])
-async def get_exercises(category: Optional[str] = None, difficulty: Optional[str] = None):
-    query = {}
-    if category:
-        query["category"] = category
-    if difficulty:
-        query["difficulty"] = difficulty
+async def get_exercises(request: Request,
+                        category: Optional[str] = None,
+                        difficulty: Optional[str] = None,
+                        muscle_group: Optional[str] = None,
+                        equipment: Optional[str] = None):
+    cache_headers = {
+        "ETag": exercise_catalog.etag,
+        "Cache-Control": f"public, max-age={EXERCISE_CACHE_MAX_AGE_SECONDS}"
+    }
+    if etag_matches(request.headers.get("if-none-match"), exercise_catalog.etag):
+        return Response(status_code=304, headers=cache_headers)
     
-    exercises = await db.exercises.find(query).to_list(length=None)
-    return [Exercise(**exercise) for exercise in exercises]
+    exercises = exercise_catalog.filter(category, difficulty, muscle_group, equipment)
+    return ORJSONResponse([exercise_catalog.documents[e.id] for e in exercises], headers=cache_headers)
+
+@api_router.get("/exercises/search")
+async def search_exercises(q: str = "",
+                           category: Optional[str] = None,
+                           difficulty: Optional[str] = None,
+                           muscle_group: Optional[str] = None,
+                           equipment: Optional[str] = None,
+                           limit: int = Query(20, ge=1, le=100)):
+    return exercise_catalog.search(q, category, difficulty, muscle_group, equipment, limit)
 
 # Workout routes
-@api_router.post("/workouts", response_model=Workout)
+@api_router.post("/workouts", response_model=WorkoutWithRecords)
 async def create_workout(workout_data: WorkoutCreate, current_user: User = Depends(get_current_user)):
     workout = Workout(
         user_id=current_user.id,
@@ -261,16 +2182,40 @@ async def create_workout(workout_data: WorkoutCreate, current_user: User = Depen
         notes=workout_data.notes
     )
     
-    await db.workouts.insert_one(workout.dict())
-    return workout
+    workout_doc = workout.dict()
+    await db.workouts.insert_one(workout_doc)
+    await record_workout_in_stats(workout_doc, workout_doc.pop("_id"))
+    new_records = await record_personal_records(current_user.id, [workout_doc])
+    return WorkoutWithRecords(**workout_doc, new_records=new_records)
+
+@api_router.post("/workouts/bulk")
+async def create_workouts_bulk(items: List[dict], current_user: User = Depends(get_current_user)):
+    def build_document(item):
+        workout_data = WorkoutImport(**item)
+        return Workout(
+            id=import_id(current_user.id, "workout", workout_data.idempotency_key),
+            user_id=current_user.id,
+            name=workout_data.name,
+            date=workout_data.date or datetime.now(timezone.utc),
+            exercises=workout_data.exercises,
+            duration=workout_data.duration,
+            notes=workout_data.notes
+        ).dict()
+    
+    outcome, created = await bulk_insert(db.workouts, items, build_document)
+    if created:
+        await rebuild_user_stats(current_user.id)
+        await record_personal_records(current_user.id, created)
+    return outcome
 
 @api_router.get("/workouts", response_model=List[Workout])
-async def get_workouts(current_user: User = Depends(get_current_user), limit: int = 20):
-    workouts = await db.workouts.find(
-        {"user_id": current_user.id}
-    ).sort("date", -1).limit(limit).to_list(length=None)
+async def get_workouts(current_user: User = Depends(get_current_user),
+                       limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+                       cursor: Optional[str] = None):
+    workouts, headers = await fetch_page(db.workouts, {"user_id": current_user.id}, cursor, limit)
     
-    return [Workout(**workout) for workout in workouts]
+    # Stored documents already have the Workout shape; skip per-row model validation
+    return ORJSONResponse(workouts, headers=headers)
 
 @api_router.get("/workouts/{workout_id}", response_model=Workout)
 async def get_workout(workout_id: str, current_user: User = Depends(get_current_user)):
@@ -284,6 +2229,37 @@ async def get_workout(workout_id: str, current_user: User = Depends(get_current_
     
     return Workout(**workout)
 
+# Personal record routes
+@api_router.get("/records")
+async def get_personal_records(current_user: User = Depends(get_current_user)):
+    records = await db.personal_records.find({"user_id": current_user.id}, {"_id": 0}).to_list(length=None)
+    return ORJSONResponse(records)
+
+@api_router.get("/leaderboards/{exercise_id}")
+async def get_leaderboard(exercise_id: str,
+                          current_user: User = Depends(get_current_user),
+                          record: str = "max_weight",
+                          limit: int = Query(10, ge=1, le=LEADERBOARD_MAX_SIZE)):
+    if record not in PERSONAL_RECORD_FIELDS:
+        raise HTTPException(status_code=400, detail=f"record must be one of {', '.join(PERSONAL_RECORD_FIELDS)}")
+    if exercise_id not in exercise_catalog.by_id:
+        raise HTTPException(status_code=404, detail="Exercise not found")
+    
+    board = personal_record_boards.get(exercise_id, record) or Leaderboard()
+    top = board.top(limit)
+    users = await db.users.find({"id": {"$in": [user_id for user_id, _ in top]}}, {"_id": 0, "id": 1, "name": 1}).to_list(length=None)
+    names = {user["id"]: user["name"] for user in users}
+    return {
+        "exercise_id": exercise_id,
+        "record": record,
+        "total": len(board),
+        "top": [
+            {"rank": board.rank(user_id), "user_id": user_id, "name": names.get(user_id), "value": value}
+            for user_id, value in top
+        ],
+        "me": {"rank": board.rank(current_user.id), "value": board.scores.get(current_user.id)}
+    }
+
 # Progress tracking routes
 @api_router.post("/progress", response_model=Progress)
 async def add_progress(progress_data: ProgressCreate, current_user: User = Depends(get_current_user)):
@@ -296,80 +2272,828 @@ async def add_progress(progress_data: ProgressCreate, current_user: User = Depen
         notes=progress_data.notes
     )
     
-    await db.progress.insert_one(progress.dict())
+    progress_doc = progress.dict()
+    await db.progress.insert_one(progress_doc)
+    progress_doc.pop("_id", None)
+    await record_progress_in_stats(progress_doc)
+    await record_progress_in_rollups([progress_doc])
     return progress
 
-@api_router.get("/progress", response_model=List[Progress])
-async def get_progress(current_user: User = Depends(get_current_user), days: int = 90):
+@api_router.post("/progress/bulk")
+async def add_progress_bulk(items: List[dict], current_user: User = Depends(get_current_user)):
+    def build_document(item):
+        progress_data = ProgressImport(**item)
+        return Progress(
+            id=import_id(current_user.id, "progress", progress_data.idempotency_key),
+            user_id=current_user.id,
+            date=progress_data.date or datetime.now(timezone.utc),
+            weight=progress_data.weight,
+            body_fat=progress_data.body_fat,
+            measurements=progress_data.measurements,
+            notes=progress_data.notes
+        ).dict()
+    
+    outcome, created = await bulk_insert(db.progress, items, build_document)
+    if created:
+        await rebuild_user_stats(current_user.id)
+        await record_progress_in_rollups(created)
+    return outcome
+
+@api_router.get("/progress", response_model=Union[List[Progress], List[ProgressRollup]])
+async def get_progress(current_user: User = Depends(get_current_user),
+                       days: int = 90,
+                       limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                       cursor: Optional[str] = None,
+                       resolution: str = "auto"):
     start_date = datetime.now(timezone.utc) - timedelta(days=days)
     
-    progress_data = await db.progress.find({
+    if resolution == "auto":
+        resolution = "raw" if cursor else pick_resolution(days)
+    if resolution != "raw" and resolution not in ROLLUP_RESOLUTIONS:
+        raise HTTPException(status_code=400, detail="resolution must be auto, raw, day, week or month")
+    if resolution != "raw":
+        buckets = await read_db.progress_rollups.find({
+            "user_id": current_user.id,
+            "resolution": resolution,
+            "bucket": {"$gte": bucket_start(start_date, resolution)}
+        }, {"_id": 0, "entry_ids": 0}).sort("bucket", -1).to_list(length=None)
+        return ORJSONResponse([rollup_point(bucket) for bucket in buckets])
+    
+    progress_data, headers = await fetch_page(read_db.progress, {
         "user_id": current_user.id,
         "date": {"$gte": start_date}
-    }).sort("date", -1).to_list(length=None)
+    }, cursor, limit)
     
-    return [Progress(**p) for p in progress_data]
+    return ORJSONResponse(progress_data, headers=headers)
 
-# AI Coach routes
-@api_router.post("/ai/ask")
-async def ask_ai_coach(question_data: AIQuestion, current_user: User = Depends(get_current_user)):
-    try:
-        # Get user's recent workouts for context
-        recent_workouts = await db.workouts.find(
-            {"user_id": current_user.id}
-        ).sort("date", -1).limit(5).to_list(length=None)
-        
-        # Get user's recent progress
-        recent_progress = await db.progress.find(
-            {"user_id": current_user.id}
-        ).sort("date", -1).limit(3).to_list(length=None)
-        
-        # Build context for AI
-        context = f"""
+# AI coach helpers
+COACH_MODEL_PROVIDER = "openai"
+COACH_MODEL_NAME = "gpt-4o"
+COACH_CONTEXT_WORKOUTS = int(os.environ.get('COACH_CONTEXT_WORKOUTS', '20'))
+COACH_CONTEXT_PROGRESS = int(os.environ.get('COACH_CONTEXT_PROGRESS', '10'))
+COACH_CONTEXT_TOKEN_BUDGET = int(os.environ.get('COACH_CONTEXT_TOKEN_BUDGET', '400'))
+SSE_HEARTBEAT_SECONDS = float(os.environ.get('SSE_HEARTBEAT_SECONDS', '5'))
+AI_CACHE_SIZE = int(os.environ.get('AI_CACHE_SIZE', '2000'))
+AI_CACHE_TTL_SECONDS = int(os.environ.get('AI_CACHE_TTL_SECONDS', '86400'))
+
+class AnswerCache:
+    """TTL + LRU cache of coach answers keyed on the normalised question and the prompt context."""
+
+    def __init__(self, maxsize: int, ttl: int, shared: Optional[SharedState] = None):
+        self.ttl = ttl
+        self.shared = shared
+        self.hits = 0
+        self.misses = 0
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    @staticmethod
+    def key(question: str, context: str) -> str:
+        normalised = " ".join(re.sub(r"[^\w\s]", " ", question.lower()).split())
+        return hashlib.sha256(f"{normalised}\0{context}".encode()).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        answer = self._cache.get(key)
+        if answer is None and self.shared is not None:
+            # Answers never change for a key, so the local copy needs no invalidation
+            answer = await self.shared.get(f"ai_answer:{key}")
+            if answer is not None:
+                self._cache[key] = answer
+        if answer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return answer
+
+    async def set(self, key: str, answer: str):
+        self._cache[key] = answer
+        if self.shared is not None:
+            await self.shared.set(f"ai_answer:{key}", answer, self.ttl)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._cache),
+            "maxsize": self._cache.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+# With a shared backend, answers cached by one worker are served by all of them
+answer_cache = AnswerCache(
+    AI_CACHE_SIZE,
+    AI_CACHE_TTL_SECONDS,
+    shared=None if isinstance(shared_state, MemorySharedState) else shared_state
+)
+
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', '8'))
+LLM_MAX_WAITING = int(os.environ.get('LLM_MAX_WAITING', '32'))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('LLM_QUEUE_TIMEOUT_SECONDS', '10'))
+LLM_RETRY_AFTER_SECONDS = int(os.environ.get('LLM_RETRY_AFTER_SECONDS', '5'))
+
+class CoachBusy(Exception):
+    pass
+
+class CoachClientPool:
+    """Builds LlmChat clients for the coach and caps how many completions are in flight.
+
+    LlmChat binds the session and system prompt when it is constructed, so clients cannot be
+    shared between users; what the pool shares is the concurrency budget. Callers beyond
+    max_concurrency queue for up to queue_timeout, and beyond max_waiting are turned away.
+    """
+
+    def __init__(self, api_key: Optional[str], max_concurrency: int, max_waiting: int, queue_timeout: float):
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore.locked() and self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise CoachBusy()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise CoachBusy()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def send(self, session_id: str, system_message: str, text: str) -> str:
+        queued = time.perf_counter()
+        try:
+            return await self._send(session_id, system_message, text)
+        finally:
+            # Time spent queueing for and waiting on the model doesn't count against the request
+            trace = request_trace.get()
+            if trace is not None:
+                trace.upstream_ms += (time.perf_counter() - queued) * 1000
+
+    async def _send(self, session_id: str, system_message: str, text: str) -> str:
+        async with self.slot():
+            chat = LlmChat(
+                api_key=self.api_key,
+                session_id=session_id,
+                system_message=system_message
+            ).with_model(COACH_MODEL_PROVIDER, COACH_MODEL_NAME)
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                response = await chat.send_message(UserMessage(text=text))
+                outcome = "ok"
+                return response
+            finally:
+                llm_request_latency.observe(time.perf_counter() - start, outcome)
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+        }
+
+coach_pool: Optional[CoachClientPool] = None
+
+def coach_busy_error() -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="AI coach is busy, please retry shortly",
+        headers={"Retry-After": str(LLM_RETRY_AFTER_SECONDS)}
+    )
+
+AI_RATE_LIMIT_REQUESTS = int(os.environ.get('AI_RATE_LIMIT_REQUESTS', '30'))
+AI_RATE_LIMIT_WINDOW_SECONDS = int(os.environ.get('AI_RATE_LIMIT_WINDOW_SECONDS', '60'))
+
+async def enforce_ai_rate_limit(current_user: User = Depends(get_current_user)):
+    """Fixed-window limit on coach questions per user, counted across all workers; 0 disables it."""
+    if AI_RATE_LIMIT_REQUESTS <= 0:
+        return
+    now = time.time()
+    window = int(now // AI_RATE_LIMIT_WINDOW_SECONDS)
+    count = await shared_state.incr(f"rate:ai:{current_user.id}:{window}", AI_RATE_LIMIT_WINDOW_SECONDS)
+    if count > AI_RATE_LIMIT_REQUESTS:
+        retry_after = max(1, int((window + 1) * AI_RATE_LIMIT_WINDOW_SECONDS - now))
+        raise HTTPException(
+            status_code=429,
+            detail="Too many AI coach questions, please wait before asking again",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+def coach_session_id(user_id: str) -> str:
+    return f"fitness_coach_{user_id}"
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text; good enough for budgeting
+    return (len(text) + 3) // 4
+
+def format_number(value: float) -> str:
+    return f"{value:,.1f}".rstrip("0").rstrip(".")
+
+async def exercise_names(exercise_ids) -> dict:
+    names = {i: exercise_catalog.by_id[i].name for i in exercise_ids if i in exercise_catalog.by_id}
+    missing = [i for i in exercise_ids if i not in names]
+    if missing:
+        exercises = await db.exercises.find(
+            {"id": {"$in": missing}},
+            {"_id": 0, "id": 1, "name": 1}
+        ).to_list(length=None)
+        names.update({e["id"]: e["name"] for e in exercises})
+    return names
+
+def summarize_exercises(workouts: List[dict], names: dict) -> List[str]:
+    """One line per exercise with session count, volume trend and best set, busiest first."""
+    per_exercise = {}
+    for workout in sorted(workouts, key=lambda w: w["date"]):
+        for entry in workout.get("exercises", []):
+            sets, reps, weight = entry.get("sets") or 0, entry.get("reps") or 0, entry.get("weight") or 0.0
+            item = per_exercise.setdefault(entry["exercise_id"], {"volumes": [], "best": None, "duration": 0})
+            item["volumes"].append(sets * reps * weight)
+            item["duration"] += entry.get("duration") or 0
+            if weight and (item["best"] is None or (weight, reps) > item["best"]):
+                item["best"] = (weight, reps)
+    
+    lines = []
+    for exercise_id, item in per_exercise.items():
+        name = names.get(exercise_id, f"exercise {exercise_id[:8]}")
+        sessions = len(item["volumes"])
+        parts = [f"{sessions} session{'s' if sessions != 1 else ''}"]
+        total_volume = sum(item["volumes"])
+        if total_volume:
+            parts.append(f"volume {format_number(total_volume)}")
+            first, last = item["volumes"][0], item["volumes"][-1]
+            if sessions > 1 and first:
+                parts.append(f"trend {(last - first) / first:+.0%}")
+        if item["best"]:
+            parts.append(f"best {format_number(item['best'][0])}x{item['best'][1]}")
+        if item["duration"]:
+            parts.append(f"{item['duration'] // 60} min total")
+        lines.append((-sessions, -total_volume, name, f"- {name}: {', '.join(parts)}"))
+    return [line for *_, line in sorted(lines)]
+
+def summarize_progress(progress: List[dict]) -> List[str]:
+    lines = []
+    entries = sorted(progress, key=lambda p: p["date"])
+    for field, label in (("weight", "Weight"), ("body_fat", "Body fat")):
+        values = [(p["date"], p[field]) for p in entries if p.get(field) is not None]
+        if not values:
+            continue
+        (first_date, first), (last_date, last) = values[0], values[-1]
+        line = f"- {label}: {format_number(last)} on {as_utc(last_date).date().isoformat()}"
+        if len(values) > 1:
+            line += f" ({last - first:+.1f} since {as_utc(first_date).date().isoformat()})"
+        lines.append(line)
+    return lines
+
+def fit_to_budget(lines: List[str], budget: int) -> List[str]:
+    kept, used = [], 0
+    for index, line in enumerate(lines):
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            kept.append(f"- ...and {len(lines) - index} more")
+            break
+        kept.append(line)
+        used += cost
+    return kept
+
+async def build_training_summary(user_id: str, token_budget: int = COACH_CONTEXT_TOKEN_BUDGET) -> dict:
+    """Compact, deterministic digest of recent training and body metrics for the coach prompt."""
+    workouts = await db.workouts.find(
+        {"user_id": user_id},
+        {"_id": 0, "date": 1, "exercises": 1}
+    ).sort("date", -1).limit(COACH_CONTEXT_WORKOUTS).to_list(length=None)
+    progress = await db.progress.find(
+        {"user_id": user_id},
+        {"_id": 0, "date": 1, "weight": 1, "body_fat": 1}
+    ).sort("date", -1).limit(COACH_CONTEXT_PROGRESS).to_list(length=None)
+    
+    names = await exercise_names({e["exercise_id"] for w in workouts for e in w.get("exercises", [])})
+    
+    progress_lines = summarize_progress(progress)
+    workout_lines = []
+    if workouts:
+        dates = [as_utc(w["date"]).date() for w in workouts]
+        workout_lines.append(f"- {len(workouts)} workouts from {min(dates).isoformat()} to {max(dates).isoformat()}")
+        workout_lines += summarize_exercises(workouts, names)
+    
+    # Body metrics are short and always kept; exercises share whatever budget is left
+    progress_budget = sum(estimate_tokens(line) + 1 for line in progress_lines)
+    return {
+        "workouts": "\n".join(fit_to_budget(workout_lines, token_budget - progress_budget)),
+        "progress": "\n".join(progress_lines),
+    }
+
+async def build_coach_context(current_user: User) -> str:
+    # Nothing identifying goes in here: users with the same profile and history share cached answers
+    summary = await build_training_summary(current_user.id)
+    
+    return f"""
 You are an expert fitness coach and personal trainer. Help the user with their fitness journey.
 
 User Profile:
-- Name: {current_user.name}
 - Experience Level: {current_user.experience_level}
 - Fitness Goals: {', '.join(current_user.fitness_goals) if current_user.fitness_goals else 'Not specified'}
 
-Recent Workout History:
-{str(recent_workouts) if recent_workouts else 'No recent workouts'}
+Recent Workout History (exercise: sessions, volume as sets x reps x weight, trend first to last session, best weight x reps):
+{summary["workouts"] or 'No recent workouts'}
 
 Recent Progress:
-{str(recent_progress) if recent_progress else 'No recent progress data'}
+{summary["progress"] or 'No recent progress data'}
 
 Provide helpful, encouraging, and safe fitness advice. Always recommend consulting with healthcare professionals for medical concerns.
 """
-        
-        # Initialize AI chat
-        chat = LlmChat(
-            api_key=os.environ.get('EMERGENT_LLM_KEY'),
-            session_id=f"fitness_coach_{current_user.id}",
-            system_message=context
-        ).with_model("openai", "gpt-4o")
-        
-        # Send message
-        user_message = UserMessage(text=question_data.question)
-        response = await chat.send_message(user_message)
-        
-        # Save conversation
-        conversation = AIConversation(
-            user_id=current_user.id,
-            session_id=f"fitness_coach_{current_user.id}",
-            messages=[
-                {"role": "user", "content": question_data.question, "timestamp": datetime.now(timezone.utc).isoformat()},
-                {"role": "assistant", "content": response, "timestamp": datetime.now(timezone.utc).isoformat()}
-            ]
+
+# Questions that lean on the conversation so far ("why?", "what about squats?", "do that again").
+# Misfiring only costs a cache miss, so the list errs towards treating questions as follow-ups.
+FOLLOW_UP_PATTERN = re.compile(
+    r"\b(it|its|that|this|those|these|they|them|again|above|earlier|previous|before|instead|"
+    r"also|else|same|you said|you mentioned|you suggested|what about|how about)\b"
+)
+STANDALONE_MIN_WORDS = 4
+
+def is_standalone_question(question: str) -> bool:
+    words = search_tokens(question)
+    return len(words) >= STANDALONE_MIN_WORDS and not FOLLOW_UP_PATTERN.search(" ".join(words))
+
+async def ask_coach(current_user: User, question: str, use_cache: bool = True):
+    """Answer a question, returning (answer, served_from_cache)."""
+    (context, (summary, messages)) = await asyncio.gather(
+        build_coach_context(current_user),
+        load_coach_memory(current_user.id)
+    )
+    budget = AI_PROMPT_TOKEN_BUDGET - estimate_tokens(context) - estimate_tokens(question)
+    memory = build_memory_block(summary, messages, budget)
+    if memory and not is_standalone_question(question):
+        # A follow-up needs the conversation, and a prompt carrying it is unique to this ask
+        response = await coach_pool.send(coach_session_id(current_user.id), f"{context}\n{memory}\n", question)
+        return response, False
+    
+    # First questions and standalone ones are answered from the profile and training context
+    # alone, so the answer only depends on what the key covers and can be shared
+    cache_key = AnswerCache.key(question, context)
+    if use_cache:
+        cached_answer = await answer_cache.get(cache_key)
+        if cached_answer is not None:
+            return cached_answer, True
+    
+    response = await coach_pool.send(coach_session_id(current_user.id), context, question)
+    await answer_cache.set(cache_key, response)
+    return response, False
+
+# Conversation history
+# Turns are appended to per-session bucket documents holding up to AI_HISTORY_BUCKET_TURNS turns,
+# so loading recent history is one indexed read of the newest bucket or two. Each exchange takes
+# the next turn number from a counter in ai_sessions, and the turn number alone decides which
+# bucket it lands in, so concurrent writers can never open two buckets for the same range.
+AI_HISTORY_BUCKET_TURNS = int(os.environ.get('AI_HISTORY_BUCKET_TURNS', '25'))
+AI_HISTORY_BUCKET_MESSAGES = 2 * AI_HISTORY_BUCKET_TURNS
+AI_HISTORY_MAX_PAGE = 200
+
+def history_bucket_seq(turn: int) -> int:
+    return (turn - 1) // AI_HISTORY_BUCKET_TURNS
+
+def history_bucket_id(session_id: str, seq: int) -> str:
+    return f"{session_id}:{seq}"
+
+async def save_coach_exchange(current_user: User, question: str, response: str):
+    now = datetime.now(timezone.utc)
+    session_id = coach_session_id(current_user.id)
+    session = await db.ai_sessions.find_one_and_update(
+        {"session_id": session_id},
+        {"$inc": {"turns": 1}, "$setOnInsert": {"user_id": current_user.id}},
+        projection={"_id": 0, "turns": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    turn = session["turns"]
+    seq = history_bucket_seq(turn)
+    index = 2 * (turn - 1)  # of the question within the session; the answer follows it
+    await write_queue.put("ai_conversation_buckets", [UpdateOne(
+        # The index guard makes a repeated write a no-op; $sort keeps turns in order however they land
+        {"id": history_bucket_id(session_id, seq), "messages.index": {"$ne": index}},
+        {
+            "$push": {"messages": {
+                "$each": [
+                    {"index": index, "role": "user", "content": question, "timestamp": now.isoformat()},
+                    {"index": index + 1, "role": "assistant", "content": response, "timestamp": now.isoformat()}
+                ],
+                "$sort": {"index": 1}
+            }},
+            "$inc": {"count": 2},
+            "$set": {"updated_at": now},
+            "$setOnInsert": {"session_id": session_id, "user_id": current_user.id, "seq": seq, "created_at": now},
+        },
+        upsert=True
+    )])
+
+def encode_history_cursor(seq: int, index: int) -> str:
+    payload = json.dumps({"seq": seq, "index": index})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_history_cursor(cursor: str):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return int(payload["seq"]), int(payload["index"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def conversation_history(session_id: str, limit: int, cursor: Optional[str] = None):
+    """The `limit` messages before cursor (newest first by default), oldest first, and the next cursor."""
+    query = {"session_id": session_id}
+    cursor_seq, cursor_index = None, None
+    if cursor:
+        cursor_seq, cursor_index = decode_history_cursor(cursor)
+        query["seq"] = {"$lte": cursor_seq}
+    # Buckets are usually full, so this many covers a page in one batch
+    buckets = db.ai_conversation_buckets.find(
+        query, {"_id": 0, "seq": 1, "messages": 1}, batch_size=limit // AI_HISTORY_BUCKET_MESSAGES + 2
+    ).sort("seq", DESCENDING)
+    
+    messages, next_cursor, previous_seq = [], None, None
+    async for bucket in buckets:
+        if len(messages) >= limit:
+            # The page ended on a bucket boundary and older buckets remain
+            next_cursor = encode_history_cursor(previous_seq, 0)
+            break
+        end = cursor_index if bucket["seq"] == cursor_seq else len(bucket["messages"])
+        start = max(0, end - (limit - len(messages)))
+        messages[:0] = bucket["messages"][start:end]
+        previous_seq = bucket["seq"]
+        if start > 0:
+            next_cursor = encode_history_cursor(bucket["seq"], start)
+            break
+    await buckets.close()
+    return messages, next_cursor
+
+async def migrate_conversations_to_buckets():
+    """One-off move of the old one-document-per-exchange ai_conversations into buckets.
+    
+    Old exchanges are numbered so that the last one is turn 0, ahead of anything the live counter
+    hands out, and bucket ids follow from the turn numbers: a rerun writes the same documents.
+    """
+    try:
+        if await db.migrations.find_one({"_id": "ai_conversation_buckets"}) or not await db.ai_conversations.find_one({}):
+            return
+        async with maintenance_lock("ai_conversation_buckets") as acquired:
+            if not acquired:
+                return
+            legacy_turns = {
+                group["_id"]: group["turns"]
+                for group in await db.ai_conversations.aggregate(
+                    [{"$group": {"_id": "$session_id", "turns": {"$sum": 1}}}]
+                ).to_list(length=None)
+            }
+            # A session belongs to one user, so the user_id_created_at index gives the same grouping
+            cursor = db.ai_conversations.find({}, {"_id": 0}, batch_size=EXPORT_BATCH_SIZE).sort(
+                [("user_id", ASCENDING), ("created_at", ASCENDING)]
+            )
+            buckets, session_id, turn = {}, None, 0
+            async for conversation in cursor:
+                if conversation["session_id"] != session_id:
+                    session_id = conversation["session_id"]
+                    turn = 1 - legacy_turns[session_id]
+                else:
+                    turn += 1
+                seq = history_bucket_seq(turn)
+                bucket = buckets.get((session_id, seq))
+                if bucket is None:
+                    bucket = buckets[(session_id, seq)] = AIConversationBucket(
+                        id=history_bucket_id(session_id, seq),
+                        user_id=conversation["user_id"],
+                        session_id=session_id,
+                        seq=seq,
+                        created_at=conversation["created_at"]
+                    ).dict()
+                bucket["messages"] += [
+                    {"index": 2 * (turn - 1) + offset, **message}
+                    for offset, message in enumerate(conversation["messages"])
+                ]
+                bucket["count"] += len(conversation["messages"])
+                bucket["updated_at"] = conversation["created_at"]
+            try:
+                await db.ai_conversation_buckets.insert_many(list(buckets.values()), ordered=False)
+            except BulkWriteError as e:
+                # Buckets left behind by an interrupted run are identical; anything else is a real failure
+                if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                    raise
+            await db.migrations.update_one(
+                {"_id": "ai_conversation_buckets"},
+                {"$set": {"completed_at": datetime.now(timezone.utc)}},
+                upsert=True
+            )
+            logger.info(f"Moved AI conversations into {len(buckets)} buckets")
+    except Exception as e:
+        logger.warning(f"AI conversation migration failed: {e}")
+
+conversation_migration_task: Optional[asyncio.Task] = None
+
+# Coach memory
+# The last AI_MEMORY_RECENT_TURNS turns go into the prompt verbatim; older turns are folded into a
+# rolling summary kept in ai_sessions. Summaries are refreshed in the background once enough turns
+# have aged out, so answering never waits on them. The whole prompt is trimmed to
+# AI_PROMPT_TOKEN_BUDGET before it is sent: oldest verbatim turns go first, then the summary is cut.
+AI_MEMORY_RECENT_TURNS = int(os.environ.get('AI_MEMORY_RECENT_TURNS', '6'))
+AI_MEMORY_SUMMARY_BATCH_TURNS = int(os.environ.get('AI_MEMORY_SUMMARY_BATCH_TURNS', '6'))
+AI_MEMORY_SUMMARY_TOKENS = int(os.environ.get('AI_MEMORY_SUMMARY_TOKENS', '300'))
+AI_MEMORY_MESSAGE_CHARS = int(os.environ.get('AI_MEMORY_MESSAGE_CHARS', '800'))
+AI_PROMPT_TOKEN_BUDGET = int(os.environ.get('AI_PROMPT_TOKEN_BUDGET', '2000'))
+MEMORY_SUMMARY_SYSTEM_MESSAGE = (
+    "You maintain a running summary of a conversation between a user and their fitness coach. "
+    f"Merge the new turns into the existing summary in at most {AI_MEMORY_SUMMARY_TOKENS * 3 // 4} words. "
+    "Keep goals, injuries, preferences, plans and advice already given; drop small talk. "
+    "Reply with the summary only."
+)
+
+summaries_in_progress = set()
+
+def clip(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+def render_turns(messages: List[dict]) -> List[str]:
+    """One block per turn; a reply without its question (or the reverse) still renders."""
+    turns, current = [], []
+    for message in messages:
+        if message["role"] == "user" and current:
+            turns.append("\n".join(current))
+            current = []
+        speaker = "User" if message["role"] == "user" else "Coach"
+        current.append(f"{speaker}: {clip(message['content'], AI_MEMORY_MESSAGE_CHARS)}")
+    if current:
+        turns.append("\n".join(current))
+    return turns
+
+def build_memory_block(summary: Optional[str], messages: List[dict], budget: int) -> str:
+    """Summary plus as many of the newest turns as fit in budget tokens."""
+    if budget <= 0:
+        return ""
+    parts = []
+    if summary:
+        summary = clip(summary, min(AI_MEMORY_SUMMARY_TOKENS, budget // 2) * 4)
+        parts.append(f"Summary of the earlier conversation:\n{summary}")
+        budget -= estimate_tokens(parts[0])
+    kept = []
+    for turn in reversed(render_turns(messages)):
+        cost = estimate_tokens(turn) + 1
+        if cost > budget:
+            break
+        kept.insert(0, turn)
+        budget -= cost
+    if kept:
+        parts.append("Most recent turns, oldest first:\n" + "\n\n".join(kept))
+    return "\n\n".join(parts)
+
+async def unsummarized_messages(session_id: str, after: Optional[int], before: int, limit: int) -> List[dict]:
+    """Up to limit messages with after <= index < before, oldest first."""
+    seq_range = {"$lte": history_bucket_seq(before // 2 + 1)}
+    if after is not None:
+        seq_range["$gte"] = history_bucket_seq(after // 2 + 1)
+    buckets = db.ai_conversation_buckets.find(
+        {"session_id": session_id, "seq": seq_range}, {"_id": 0, "messages": 1}
+    ).sort("seq", ASCENDING)
+    messages = []
+    async for bucket in buckets:
+        messages += [
+            message for message in bucket["messages"]
+            if (after is None or message["index"] >= after) and message["index"] < before
+        ]
+        if len(messages) >= limit:
+            break
+    await buckets.close()
+    return messages[:limit]
+
+async def load_coach_memory(user_id: str):
+    """(summary, recent messages) for the user's session; schedules a summary refresh when one is due."""
+    session_id = coach_session_id(user_id)
+    recent_count = 2 * AI_MEMORY_RECENT_TURNS
+    batch = 2 * AI_MEMORY_SUMMARY_BATCH_TURNS
+    session, (recent, _) = await asyncio.gather(
+        db.ai_sessions.find_one({"session_id": session_id}, {"_id": 0}),
+        conversation_history(session_id, recent_count)
+    )
+    session = session or {}
+    if not recent:
+        return session.get("summary"), []
+    # Everything from the marker up to the recent window, read forward so that turns left behind by
+    # a skipped refresh are summarised by the next one rather than sliding out of view
+    summarized_until = session.get("summarized_until")
+    pending = await unsummarized_messages(session_id, summarized_until, recent[0]["index"], 2 * batch)
+    
+    if len(pending) >= batch and session_id not in summaries_in_progress:
+        summaries_in_progress.add(session_id)
+        # Not part of this request: a clean context keeps its LLM and Mongo time off the request trace
+        task = run_in_background(
+            refresh_session_summary(user_id, session_id, session.get("summary"), summarized_until, pending[:batch]),
+            context=contextvars.Context()
         )
+        task.add_done_callback(lambda _: summaries_in_progress.discard(session_id))
+    # Turns that aged out but aren't summarised yet stay verbatim so nothing drops out of the prompt
+    return session.get("summary"), pending + recent
+
+async def refresh_session_summary(user_id: str, session_id: str, summary: Optional[str],
+                                  summarized_until: Optional[int], messages: List[dict]):
+    transcript = "\n\n".join(render_turns(messages))
+    prompt = f"Existing summary:\n{summary or '(none yet)'}\n\nNew turns:\n{transcript}"
+    try:
+        new_summary = await coach_pool.send(f"{session_id}_summary", MEMORY_SUMMARY_SYSTEM_MESSAGE, prompt)
+        # Only advance from the state we summarised, and only past the messages we sent; a worker
+        # that got there first wins
+        await db.ai_sessions.update_one(
+            {"session_id": session_id, "summarized_until": summarized_until},
+            {
+                "$set": {
+                    "summary": new_summary.strip(),
+                    "summarized_until": messages[-1]["index"] + 1,
+                    "updated_at": datetime.now(timezone.utc)
+                },
+                "$setOnInsert": {"user_id": user_id},
+            },
+            upsert=True
+        )
+    except DuplicateKeyError:
+        pass
+    except CoachBusy:
+        logger.info(f"Skipped summarising {session_id}: coach pool busy")
+    except Exception as e:
+        logger.warning(f"Summarising {session_id} failed: {e}")
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def coach_event_stream(current_user: User, question: str, use_cache: bool):
+    # The pinned LlmChat only hands back finished completions, so the stream opens right away,
+    # keeps the connection alive while the model works and then relays the reply word by word.
+    yield sse_event("start", {"session_id": coach_session_id(current_user.id)})
+    reply = asyncio.ensure_future(ask_coach(current_user, question, use_cache))
+    try:
+        while not reply.done():
+            await asyncio.wait({reply}, timeout=SSE_HEARTBEAT_SECONDS)
+            if not reply.done():
+                yield ": keep-alive\n\n"
+        response, cached = reply.result()
+        for word in re.findall(r"\s*\S+", response):
+            yield sse_event("delta", {"text": word})
+        await save_coach_exchange(current_user, question, response)
+        yield sse_event("done", {"response": response, "cached": cached})
+    except CoachBusy:
+        error = coach_busy_error()
+        yield sse_event("error", {"detail": error.detail, "retry_after": LLM_RETRY_AFTER_SECONDS})
+    except Exception as e:
+        yield sse_event("error", {"detail": f"AI service error: {str(e)}"})
+    finally:
+        # The client may hang up mid-generation; don't leave the completion running
+        if not reply.done():
+            reply.cancel()
+
+# AI Coach routes
+@api_router.post("/ai/ask", dependencies=[Depends(enforce_ai_rate_limit)])
+async def ask_ai_coach(question_data: AIQuestion, current_user: User = Depends(get_current_user)):
+    try:
+        response, cached = await ask_coach(current_user, question_data.question, question_data.use_cache)
+        await save_coach_exchange(current_user, question_data.question, response)
         
-        await db.ai_conversations.insert_one(conversation.dict())
-        
-        return {"response": response}
+        return {"response": response, "cached": cached}
         
+    except CoachBusy:
+        raise coach_busy_error()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI service error: {str(e)}")
 
+@api_router.post("/ai/ask/stream", dependencies=[Depends(enforce_ai_rate_limit)])
+async def ask_ai_coach_stream(question_data: AIQuestion, current_user: User = Depends(get_current_user)):
+    return StreamingResponse(
+        coach_event_stream(current_user, question_data.question, question_data.use_cache),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.get("/ai/history")
+async def get_ai_history(current_user: User = Depends(get_current_user),
+                         limit: int = Query(20, ge=1, le=AI_HISTORY_MAX_PAGE),
+                         cursor: Optional[str] = None):
+    messages, next_cursor = await conversation_history(coach_session_id(current_user.id), limit, cursor)
+    return ORJSONResponse(messages, headers={"X-Next-Cursor": next_cursor} if next_cursor else {})
+
+# Analytics routes
+@api_router.get("/analytics/volume")
+async def get_volume_analytics(current_user: User = Depends(get_current_user),
+                               period: str = "week",
+                               days: int = Query(180, ge=1, le=ANALYTICS_MAX_DAYS),
+                               exercise_id: Optional[str] = None):
+    date_format = analytics_period_format(period)
+    pipeline = exercise_sets_pipeline(current_user.id, days, exercise_id) + [
+        {"$group": {
+            "_id": {
+                "exercise_id": "$exercises.exercise_id",
+                "period": {"$dateToString": {"format": date_format, "date": "$date"}}
+            },
+            "volume": {"$sum": {"$multiply": [
+                {"$ifNull": ["$exercises.sets", 0]},
+                {"$ifNull": ["$exercises.reps", 0]},
+                {"$ifNull": ["$exercises.weight", 0]}
+            ]}},
+            "sets": {"$sum": {"$ifNull": ["$exercises.sets", 0]}},
+            "sessions": {"$sum": 1}
+        }}
+    ]
+    
+    series = await grouped_exercise_series(pipeline)
+    for item in series:
+        rows = item.pop("rows")
+        volume = np.array([row["volume"] for row in rows], dtype=float)
+        previous = np.concatenate(([np.nan], volume[:-1]))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            change = np.where(previous > 0, (volume - previous) / previous, np.nan)
+        item["volume"] = rounded(volume)
+        item["volume_change"] = rounded(change)
+        item["sets"] = [row["sets"] for row in rows]
+        item["sessions"] = [row["sessions"] for row in rows]
+    
+    return {"period": period, "series": series}
+
+@api_router.get("/analytics/one-rep-max")
+async def get_one_rep_max_analytics(current_user: User = Depends(get_current_user),
+                                    period: str = "week",
+                                    days: int = Query(365, ge=1, le=ANALYTICS_MAX_DAYS),
+                                    exercise_id: Optional[str] = None):
+    date_format = analytics_period_format(period)
+    # Epley estimate: weight * (1 + reps / 30), over sets that actually carried load
+    pipeline = exercise_sets_pipeline(current_user.id, days, exercise_id) + [
+        {"$match": {"exercises.weight": {"$gt": 0}, "exercises.reps": {"$gt": 0}}},
+        {"$group": {
+            "_id": {
+                "exercise_id": "$exercises.exercise_id",
+                "period": {"$dateToString": {"format": date_format, "date": "$date"}}
+            },
+            "estimated_1rm": {"$max": {"$multiply": [
+                "$exercises.weight",
+                {"$add": [1, {"$divide": ["$exercises.reps", 30]}]}
+            ]}},
+            "max_weight": {"$max": "$exercises.weight"}
+        }}
+    ]
+    
+    series = await grouped_exercise_series(pipeline)
+    for item in series:
+        rows = item.pop("rows")
+        estimated = np.array([row["estimated_1rm"] for row in rows], dtype=float)
+        item["estimated_1rm"] = rounded(estimated)
+        item["best_to_date"] = rounded(np.maximum.accumulate(estimated))
+        item["max_weight"] = [row["max_weight"] for row in rows]
+    
+    return {"period": period, "series": series}
+
+@api_router.get("/analytics/body")
+async def get_body_analytics(current_user: User = Depends(get_current_user),
+                             days: int = Query(180, ge=1, le=ANALYTICS_MAX_DAYS),
+                             window: int = Query(7, ge=1, le=90)):
+    start_date = datetime.now(timezone.utc) - timedelta(days=days)
+    entries = await db.progress.find(
+        {"user_id": current_user.id, "date": {"$gte": start_date}},
+        {"_id": 0, "date": 1, "weight": 1, "body_fat": 1}
+    ).sort("date", 1).to_list(length=None)
+    
+    weight = np.array([e.get("weight") if e.get("weight") is not None else np.nan for e in entries], dtype=float)
+    body_fat = np.array([e.get("body_fat") if e.get("body_fat") is not None else np.nan for e in entries], dtype=float)
+    
+    return {
+        "window": window,
+        "dates": [as_utc(e["date"]).isoformat() for e in entries],
+        "weight": rounded(weight),
+        "weight_avg": rounded(moving_average(weight, window)),
+        "body_fat": rounded(body_fat),
+        "body_fat_avg": rounded(moving_average(body_fat, window)),
+    }
+
+# Export routes
+@api_router.get("/export")
+async def export_history(current_user: User = Depends(get_current_user), compress: bool = False):
+    filename = f"fitness-export-{datetime.now(timezone.utc).date().isoformat()}.ndjson"
+    body = export_lines(current_user.id)
+    media_type = "application/x-ndjson"
+    if compress:
+        body = gzip_chunks(body)
+        filename += ".gz"
+        media_type = "application/gzip"
+    
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 # User profile routes
 @api_router.get("/profile", response_model=User)
 async def get_profile(current_user: User = Depends(get_current_user)):
@@ -390,40 +3114,91 @@ async def update_profile(fitness_goals: Optional[List[str]] = None,
             {"id": current_user.id},
             {"$set": update_data}
         )
+        await invalidate_sessions(user_id=current_user.id)
     
     return {"message": "Profile updated successfully"}
 
 # Dashboard stats
 @api_router.get("/dashboard/stats")
 async def get_dashboard_stats(current_user: User = Depends(get_current_user)):
-    # Get total workouts
-    total_workouts = await db.workouts.count_documents({"user_id": current_user.id})
+    stats = await read_db.user_stats.find_one({"user_id": current_user.id}, {"_id": 0, "counted_ids": 0})
+    if not stats:
+        stats = await rebuild_user_stats(current_user.id)
     
-    # Get workouts this week
     week_ago = datetime.now(timezone.utc) - timedelta(days=7)
-    workouts_this_week = await db.workouts.count_documents({
-        "user_id": current_user.id,
-        "date": {"$gte": week_ago}
-    })
-    
-    # Get latest progress
-    latest_progress = await db.progress.find_one(
-        {"user_id": current_user.id},
-        sort=[("date", -1)]
-    )
+    workouts_this_week = await count_workouts_since(current_user.id, stats, week_ago)
+    latest_progress = stats["latest_progress"]
+    recent_workouts = stats["recent_workouts"]
     
-    # Get recent workouts
-    recent_workouts = await db.workouts.find(
-        {"user_id": current_user.id}
-    ).sort("date", -1).limit(3).to_list(length=None)
-    
-    return {
-        "total_workouts": total_workouts,
+    return ORJSONResponse({
+        "total_workouts": stats["total_workouts"],
         "workouts_this_week": workouts_this_week,
-        "latest_progress": Progress(**latest_progress).dict() if latest_progress else None,
-        "recent_workouts": [Workout(**w).dict() for w in recent_workouts]
+        "latest_progress": latest_progress,
+        "recent_workouts": recent_workouts
+    })
+
+# Admin routes
+@api_router.get("/admin/indexes", dependencies=[Depends(require_admin)])
+async def get_index_report():
+    return await index_report()
+
+@api_router.get("/admin/cache", dependencies=[Depends(require_admin)])
+async def get_cache_stats():
+    return {"sessions": session_cache.stats(), "ai_answers": answer_cache.stats()}
+
+@api_router.get("/admin/slow-requests", dependencies=[Depends(require_admin)])
+async def get_slow_requests():
+    return list(reversed(slow_requests))
+
+@api_router.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def get_profile_samples(profile_id: str):
+    if profile_id not in profiles:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(profiles[profile_id])
+
+@api_router.post("/admin/progress-rollups/backfill", dependencies=[Depends(require_admin)])
+async def run_progress_rollup_backfill(user_id: Optional[str] = None):
+    users = await backfill_progress_rollups(user_id)
+    if users is None:
+        raise HTTPException(status_code=409, detail="A progress rollup backfill is already running")
+    return {"users": users}
+
+@api_router.post("/admin/personal-records/backfill", dependencies=[Depends(require_admin)])
+async def run_personal_record_backfill(user_id: Optional[str] = None):
+    users = await backfill_personal_records(user_id)
+    if users is None:
+        raise HTTPException(status_code=409, detail="A personal record backfill is already running")
+    await personal_record_boards.refresh()
+    return {"users": users}
+
+@api_router.get("/admin/ai-pool", dependencies=[Depends(require_admin)])
+async def get_ai_pool_stats():
+    return coach_pool.stats()
+
+@api_router.get("/admin/write-queue", dependencies=[Depends(require_admin)])
+async def get_write_queue_stats():
+    return write_queue.stats()
+
+@api_router.get("/admin/mongo-pool", dependencies=[Depends(require_admin)])
+async def get_mongo_pool_stats():
+    return {
+        "read_preference": MONGO_READ_PREFERENCE,
+        "max_pool_size": MONGO_MAX_POOL_SIZE,
+        "pools": mongo_pool_metrics.stats(),
     }
 
+# Health check
+# Public, so it only says whether Mongo answers; pool details are on /admin/mongo-pool and /metrics
+@api_router.get("/health")
+async def health():
+    start = time.perf_counter()
+    try:
+        await client.admin.command("ping")
+    except Exception as e:
+        logger.warning(f"Health check ping failed: {e}")
+        return JSONResponse(status_code=503, content={"status": "unavailable"})
+    return {"status": "ok", "mongo": {"ping_ms": round((time.perf_counter() - start) * 1000, 2)}}
+
 # Root endpoint
 @api_router.get("/")
 async def root():
@@ -432,6 +3207,33 @@ async def root():
 # Include the router in the main app
 app.include_router(api_router)
 
+# Metrics endpoint, outside /api so it is only reachable by scrapers inside the cluster
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    lines = []
+    for histogram in (http_request_latency, mongo_command_latency, llm_request_latency, event_loop_lag):
+        lines += histogram.render()
+    for name, cache in (("session_cache", session_cache), ("ai_answer_cache", answer_cache)):
+        stats = cache.stats()
+        lines += gauge_lines(f"{name}_hits_total", f"{name} lookups served from memory.", stats["hits"], "counter")
+        lines += gauge_lines(f"{name}_misses_total", f"{name} lookups that missed.", stats["misses"], "counter")
+        lines += gauge_lines(f"{name}_size", f"Entries held in {name}.", stats["size"])
+    pools = mongo_pool_metrics.stats()
+    for field, name, help_text in (("open", "mongo_pool_open_connections", "Connections open in the pool."),
+                                   ("checked_out", "mongo_pool_checked_out_connections", "Connections in use."),
+                                   ("waiting", "mongo_pool_waiting_requests", "Operations waiting for a connection.")):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        lines += [f"{name}{metric_labels(('address',), (address,))} {pool[field]}" for address, pool in pools.items()]
+    queue = write_queue.stats()
+    lines += gauge_lines("write_queue_depth", "Follow-up write jobs waiting for a worker.", queue["queued"])
+    lines += gauge_lines("write_queue_written_total", "Follow-up writes applied.", queue["written"], "counter")
+    lines += gauge_lines("write_queue_failed_total", "Follow-up writes dropped after retries.", queue["failed"], "counter")
+    if coach_pool is not None:
+        lines += gauge_lines("llm_in_flight", "AI coach completions in progress.", coach_pool.in_flight)
+        lines += gauge_lines("llm_waiting", "AI coach requests queued for a slot.", coach_pool.waiting)
+        lines += gauge_lines("llm_rejected_total", "AI coach requests turned away with 429.", coach_pool.rejected, "counter")
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -439,12 +3241,48 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Added last so they wrap everything else, CORS included
+app.add_middleware(RequestTraceMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 # Initialize data on startup
 @app.on_event("startup")
 async def startup_event():
+    global http_client, coach_pool, catalog_refresh_task, rollup_backfill_task, event_loop_lag_task, leaderboard_task
+    global conversation_migration_task
+    event_loop_lag_task = asyncio.create_task(monitor_event_loop_lag())
+    write_queue.start()
+    await shared_state.start()
+    http_client = create_http_client()
+    coach_pool = CoachClientPool(
+        os.environ.get('EMERGENT_LLM_KEY'),
+        LLM_MAX_CONCURRENCY,
+        LLM_MAX_WAITING,
+        LLM_QUEUE_TIMEOUT_SECONDS
+    )
     await initialize_exercises()
+    await exercise_catalog.refresh()
+    catalog_refresh_task = asyncio.create_task(refresh_exercise_catalog_periodically())
+    rollup_backfill_task = asyncio.create_task(backfill_progress_rollups_if_empty())
+    leaderboard_task = asyncio.create_task(maintain_personal_record_boards())
+    conversation_migration_task = asyncio.create_task(migrate_conversations_to_buckets())
+    created = await ensure_indexes()
+    if created:
+        logger.info(f"Created indexes: {created}")
+    # The report is advisory only and must never keep the API from starting
+    try:
+        report = await index_report()
+    except Exception as e:
+        logger.warning(f"Index report unavailable: {e}")
+        report = {}
+    for collection_name, status in report.items():
+        if status["missing"]:
+            logger.warning(f"Missing indexes on {collection_name}: {status['missing']}")
+        if status["unmanaged"]:
+            logger.info(f"Unmanaged indexes on {collection_name}: {status['unmanaged']}")
 
 # Configure logging
 logging.basicConfig(
@@ -455,4 +3293,12 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in (catalog_refresh_task, event_loop_lag_task, leaderboard_task):
+        if task is not None:
+            task.cancel()
+    if http_client is not None:
+        await http_client.aclose()
+    await shared_state.close()
+    # Queued writes need the Mongo client, so drain them before closing it
+    await write_queue.drain(WRITE_QUEUE_DRAIN_SECONDS)
     client.close()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Backend Benchmarks for Fitness Tracker Application
+Measures the per-row cost of serializing list responses (serialization) and the
+throughput and latency percentiles of every route under concurrent load (load).
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import uuid
+import random
+import logging
+import argparse
+import warnings
+from pathlib import Path
+from datetime import datetime, timezone, timedelta
+from typing import List
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent / 'backend'))
+# Every load-test user asks far more often than the per-user AI coach limit allows
+os.environ.setdefault('AI_RATE_LIMIT_REQUESTS', '0')
+
+from fastapi.responses import ORJSONResponse, JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from server import Workout, Progress
+
+ROW_COUNTS = [1000, 10000]
+
+def make_workout(index):
+    """Workout document shaped like the ones Motor returns (naive UTC datetimes, no _id)"""
+    date = datetime(2024, 1, 1) + timedelta(hours=index)
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": "benchmark-user",
+        "name": f"Workout {index}",
+        "date": date,
+        "exercises": [
+            {"exercise_id": str(uuid.uuid4()), "sets": 3, "reps": 10, "weight": 60.0 + i,
+             "duration": 0, "rest_time": 60, "notes": ""}
+            for i in range(4)
+        ],
+        "duration": 45,
+        "notes": "",
+        "created_at": date,
+    }
+
+def make_progress(index):
+    date = datetime(2024, 1, 1) + timedelta(hours=index)
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": "benchmark-user",
+        "date": date,
+        "weight": 80.0 - index * 0.001,
+        "body_fat": 18.5,
+        "measurements": {"waist": 85, "chest": 100},
+        "notes": "",
+    }
+
+def model_path(model, docs):
+    """What the endpoints used to do: build a model per row, then let FastAPI validate and encode"""
+    field = create_response_field(name=f"Response_{model.__name__}", type_=List[model])
+    content = [model(**doc) for doc in docs]
+    encoded = asyncio.run(serialize_response(field=field, response_content=content))
+    return JSONResponse(encoded).body
+
+def fast_path(model, docs):
+    """Projected documents handed straight to orjson"""
+    return ORJSONResponse(docs).body
+
+def time_per_row(func, model, docs, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(model, docs)
+        best = min(best, time.perf_counter() - start)
+    return best / len(docs)
+
+def run_serialization_benchmark(repeat):
+    """Compare the model-per-row path with the orjson fast path"""
+    print("🚀 Serialization benchmark (best of %d runs)" % repeat)
+    print(f"{'model':<10}{'rows':>8}{'model path µs/row':>20}{'fast path µs/row':>19}{'speedup':>10}")
+    results = []
+    for model, factory in ((Workout, make_workout), (Progress, make_progress)):
+        for rows in ROW_COUNTS:
+            docs = [factory(i) for i in range(rows)]
+            # Both paths must produce the same payload for the comparison to mean anything
+            assert json.loads(model_path(model, docs[:10])) == json.loads(fast_path(model, docs[:10]))
+            slow = time_per_row(model_path, model, docs, repeat)
+            fast = time_per_row(fast_path, model, docs, repeat)
+            print(f"{model.__name__:<10}{rows:>8}{slow * 1e6:>20.2f}{fast * 1e6:>19.2f}{slow / fast:>9.1f}x")
+            results.append({"model": model.__name__, "rows": rows, "model_path": slow, "fast_path": fast})
+    return results
+
+# Load testing
+# The app runs in-process behind httpx's ASGI transport, against mongomock (or a local
+# Mongo given with --mongo-url) and a stub LLM, so numbers reflect server.py itself.
+BASELINE_FILE = Path(__file__).parent / 'benchmark_baseline.json'
+# Everything that changes the numbers; a baseline is only comparable to a run with the same values
+LOAD_SETTINGS = ("users", "workouts", "progress", "requests", "warmup", "concurrency", "llm_latency")
+
+class StubLlmChat:
+    """Stands in for LlmChat: answers after a fixed delay without calling any provider"""
+    latency = 0.05
+
+    def __init__(self, api_key=None, session_id=None, system_message=None):
+        self.session_id = session_id
+
+    def with_model(self, provider, model):
+        return self
+
+    async def send_message(self, message):
+        await asyncio.sleep(self.latency)
+        return f"Stub coach answer to: {message.text}"
+
+def load_scenarios(exercise_ids):
+    """(name, method, path, json body factory) for every route under load"""
+    return [
+        ("GET /exercises", "GET", "/api/exercises", None),
+        ("GET /exercises/search", "GET", "/api/exercises/search?q=squat", None),
+        ("GET /workouts", "GET", "/api/workouts?limit=20", None),
+        ("GET /workouts?limit=200", "GET", "/api/workouts?limit=200", None),
+        ("GET /progress", "GET", "/api/progress?days=90", None),
+        ("GET /progress?days=730", "GET", "/api/progress?days=730", None),
+        ("GET /dashboard/stats", "GET", "/api/dashboard/stats", None),
+        ("GET /analytics/volume", "GET", "/api/analytics/volume?period=week&days=180", None),
+        ("GET /profile", "GET", "/api/profile", None),
+        ("POST /workouts", "POST", "/api/workouts", lambda: {
+            "name": "Load test workout",
+            "exercises": [{"exercise_id": random.choice(exercise_ids), "sets": 3, "reps": 10, "weight": 50.0}],
+        }),
+        ("POST /progress", "POST", "/api/progress", lambda: {"weight": round(random.uniform(60, 90), 1)}),
+        ("POST /ai/ask", "POST", "/api/ai/ask", lambda: {
+            "question": random.choice(["How many rest days?", "How do I squat deeper?", "Should I deload?"]),
+        }),
+    ]
+
+class LoadTester:
+    def __init__(self, args):
+        self.args = args
+        self.tokens = []
+        self.results = {}
+
+    async def boot(self):
+        import server
+        self.server = server
+        if self.args.mongo_url:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            server.client = AsyncIOMotorClient(self.args.mongo_url)
+        else:
+            from mongomock_motor import AsyncMongoMockClient
+            server.client = AsyncMongoMockClient()
+        server.db = server.client[f"fitness_benchmark_{uuid.uuid4().hex[:8]}"]
+        server.read_db = server.db
+        StubLlmChat.latency = self.args.llm_latency
+        server.LlmChat = StubLlmChat
+        await server.startup_event()
+        # The one-off startup jobs found an empty database; let them finish and stop the leaderboard
+        # loop so nothing runs in the background of the measured requests. seed() does their work.
+        server.leaderboard_task.cancel()
+        await asyncio.gather(
+            server.rollup_backfill_task, server.conversation_migration_task, server.leaderboard_task,
+            return_exceptions=True
+        )
+
+    async def seed(self):
+        """Users with sessions, a long workout history and daily progress entries"""
+        server = self.server
+        print(f"🌱 Seeding {self.args.users} users x {self.args.workouts} workouts...")
+        exercise_ids = [e.id for e in server.exercise_catalog.exercises]
+        now = datetime.now(timezone.utc)
+        for _ in range(self.args.users):
+            user = server.User(email=f"{uuid.uuid4().hex[:8]}@benchmark.local", name="Benchmark User")
+            token = uuid.uuid4().hex
+            await server.db.users.insert_one(user.dict())
+            await server.db.user_sessions.insert_one(server.UserSession(
+                session_token=token, user_id=user.id, expires_at=now + timedelta(days=1)
+            ).dict())
+            workouts = [server.Workout(
+                user_id=user.id,
+                name=f"Workout {i}",
+                date=now - timedelta(hours=12 * i),
+                exercises=[server.WorkoutExercise(
+                    exercise_id=random.choice(exercise_ids),
+                    sets=random.randint(2, 5),
+                    reps=random.randint(5, 12),
+                    weight=random.choice([0.0, 20.0, 40.0, 60.0, 80.0, 100.0])
+                ) for _ in range(4)]
+            ).dict() for i in range(self.args.workouts)]
+            progress = [server.Progress(
+                user_id=user.id,
+                date=now - timedelta(days=i),
+                weight=80 - i * 0.01,
+                body_fat=20 - i * 0.005,
+                measurements={"waist": 85}
+            ).dict() for i in range(self.args.progress)]
+            await server.db.workouts.insert_many(workouts)
+            if progress:
+                await server.db.progress.insert_many(progress)
+            await server.rebuild_user_stats(user.id)
+            self.tokens.append(token)
+        await server.backfill_progress_rollups()
+        await server.backfill_personal_records()
+        await server.personal_record_boards.refresh()
+        await server.write_queue.join()
+        return exercise_ids
+
+    async def send(self, client, method, path, body, count):
+        """Send count requests to one route from --concurrency concurrent workers"""
+        latencies = []
+        errors = 0
+        remaining = iter(range(count))
+
+        async def worker():
+            nonlocal errors
+            for _ in remaining:
+                headers = {"Cookie": f"session_token={random.choice(self.tokens)}"}
+                start = time.perf_counter()
+                response = await client.request(method, path, json=body() if body else None, headers=headers)
+                latencies.append(time.perf_counter() - start)
+                if response.status_code >= 400:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(self.args.concurrency)))
+        return latencies, errors, time.perf_counter() - start
+
+    async def drive(self, client, name, method, path, body):
+        """Warm the route up with --warmup unrecorded requests, then measure --requests more"""
+        if self.args.warmup:
+            await self.send(client, method, path, body, self.args.warmup)
+            await self.server.write_queue.join()
+        latencies, errors, elapsed = await self.send(client, method, path, body, self.args.requests)
+        p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+        self.results[name] = {
+            "requests": len(latencies),
+            "errors": errors,
+            "rps": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(float(p50), 2),
+            "p95_ms": round(float(p95), 2),
+            "p99_ms": round(float(p99), 2),
+        }
+        result = self.results[name]
+        status = "✅" if not errors else f"❌ {errors} errors"
+        print(f"{name:<28}{result['rps']:>10}{result['p50_ms']:>10}{result['p95_ms']:>10}{result['p99_ms']:>10}  {status}")
+
+    async def run(self):
+        await self.boot()
+        try:
+            exercise_ids = await self.seed()
+            print(f"\n🚀 {self.args.requests} requests per route after {self.args.warmup} warm-up requests, "
+                  f"concurrency {self.args.concurrency}")
+            print(f"{'route':<28}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+            transport = httpx.ASGITransport(app=self.server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+                for name, method, path, body in load_scenarios(exercise_ids):
+                    await self.drive(client, name, method, path, body)
+        finally:
+            await self.server.shutdown_db_client()
+        return self.results
+
+def run_settings(args):
+    return {
+        "settings": {key: getattr(args, key) for key in LOAD_SETTINGS},
+        "backend": "mongo" if args.mongo_url else "mongomock",
+    }
+
+def baseline_matches(args):
+    """Whether the baseline (if any) was recorded with the settings of this run"""
+    if not BASELINE_FILE.exists():
+        return True
+    saved = json.loads(BASELINE_FILE.read_text())
+    current = run_settings(args)
+    if {key: saved.get(key) for key in current} == current:
+        return True
+    print(f"❌ {BASELINE_FILE.name} was recorded with {saved.get('settings')} on {saved.get('backend')}, "
+          f"this run would use {current['settings']} on {current['backend']}; not comparing")
+    return False
+
+def compare_with_baseline(results, tolerance):
+    """Print routes whose p95 or throughput regressed by more than tolerance; returns how many did"""
+    if not BASELINE_FILE.exists():
+        print(f"\nNo baseline at {BASELINE_FILE.name}; run with --save-baseline to create one")
+        return 0
+    baseline = json.loads(BASELINE_FILE.read_text())["routes"]
+    regressions = 0
+    print(f"\n📏 Comparing with {BASELINE_FILE.name} (tolerance {tolerance:.0%})")
+    for name, result in results.items():
+        if result["errors"]:
+            regressions += 1
+            print(f"❌ {name}: {result['errors']} failed requests")
+        if name not in baseline:
+            continue
+        previous = baseline[name]
+        if result["p95_ms"] > previous["p95_ms"] * (1 + tolerance) or result["rps"] < previous["rps"] * (1 - tolerance):
+            regressions += 1
+            print(f"❌ {name}: p95 {previous['p95_ms']} -> {result['p95_ms']} ms, "
+                  f"{previous['rps']} -> {result['rps']} req/s")
+    if not regressions:
+        print("✅ No regressions")
+    return regressions
+
+def run_load_test(args):
+    # Numbers from different settings aren't comparable; refuse before spending minutes on the run
+    if not args.save_baseline and not baseline_matches(args):
+        return 1
+    results = asyncio.run(LoadTester(args).run())
+    if args.save_baseline:
+        BASELINE_FILE.write_text(json.dumps({**run_settings(args), "routes": results}, indent=2) + "\n")
+        print(f"\n💾 Baseline written to {BASELINE_FILE.name}")
+        return 0
+    return compare_with_baseline(results, args.tolerance)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    serialization = subparsers.add_parser('serialization', help='per-row serialization cost of list responses')
+    serialization.add_argument('--repeat', type=int, default=5)
+    
+    load = subparsers.add_parser('load', help='throughput and latency percentiles per route')
+    load.add_argument('--mongo-url', help='use a real (local) MongoDB instead of mongomock')
+    load.add_argument('--users', type=int, default=5)
+    load.add_argument('--workouts', type=int, default=1000, help='workouts per user')
+    load.add_argument('--progress', type=int, default=365, help='progress entries per user')
+    load.add_argument('--requests', type=int, default=200, help='requests per route')
+    load.add_argument('--concurrency', type=int, default=10)
+    load.add_argument('--warmup', type=int, default=20, help='unrecorded requests per route before measuring')
+    load.add_argument('--llm-latency', type=float, default=0.05, help='stub LLM delay in seconds')
+    load.add_argument('--tolerance', type=float, default=0.25, help='allowed regression before failing')
+    load.add_argument('--save-baseline', action='store_true')
+    
+    args = parser.parse_args()
+    # server.py still uses the pydantic v1 style .dict(); keep the report readable
+    warnings.filterwarnings('ignore', category=DeprecationWarning)
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    if args.command == 'serialization':
+        run_serialization_benchmark(args.repeat)
+        return 0
+    return run_load_test(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
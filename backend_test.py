@@ -31,6 +31,8 @@ class FitnessAPITester:
             'progress': {'passed': 0, 'failed': 0, 'errors': []},
             'ai_coach': {'passed': 0, 'failed': 0, 'errors': []},
             'dashboard': {'passed': 0, 'failed': 0, 'errors': []},
+            'export': {'passed': 0, 'failed': 0, 'errors': []},
+            'analytics': {'passed': 0, 'failed': 0, 'errors': []},
             'profile': {'passed': 0, 'failed': 0, 'errors': []}
         }
         
@@ -51,6 +53,11 @@ class FitnessAPITester:
             response = self.session.get(f"{API_BASE}/")
             if response.status_code == 200:
                 print("✅ API is accessible")
+                health = self.session.get(f"{API_BASE}/health")
+                if health.status_code == 200 and health.json().get("status") == "ok":
+                    print("✅ Health check reports MongoDB reachable")
+                else:
+                    print(f"⚠️ Health check returned {health.status_code}")
                 return True
             else:
                 print(f"❌ API connectivity failed: {response.status_code}")
@@ -164,6 +171,21 @@ class FitnessAPITester:
         except Exception as e:
             self.log_result('exercises', 'Filter by difficulty', False, str(e))
     
+        # Test exercise search
+        try:
+            response = self.session.get(f"{API_BASE}/exercises/search?q=squat")
+            if response.status_code == 200:
+                data = response.json()
+                if all(key in data for key in ['total', 'results', 'facets']):
+                    self.log_result('exercises', 'Search exercises', True)
+                else:
+                    self.log_result('exercises', 'Search exercises', False, "Invalid response format")
+            else:
+                self.log_result('exercises', 'Search exercises', False, 
+                              f"Status code: {response.status_code}")
+        except Exception as e:
+            self.log_result('exercises', 'Search exercises', False, str(e))
+    
     def test_workout_management_api(self):
         """Test workout management endpoints"""
         print("\n🏋️ Testing Workout Management API...")
@@ -191,6 +213,17 @@ class FitnessAPITester:
         except Exception as e:
             self.log_result('workouts', 'Create workout without auth', False, str(e))
         
+        # Test bulk workout import without authentication
+        try:
+            response = self.session.post(f"{API_BASE}/workouts/bulk", json=[workout_data])
+            if response.status_code == 401:
+                self.log_result('workouts', 'Bulk import workouts without auth', True)
+            else:
+                self.log_result('workouts', 'Bulk import workouts without auth', False, 
+                              f"Expected 401, got {response.status_code}")
+        except Exception as e:
+            self.log_result('workouts', 'Bulk import workouts without auth', False, str(e))
+        
         # Test get workouts without authentication
         try:
             response = self.session.get(f"{API_BASE}/workouts")
@@ -212,6 +245,19 @@ class FitnessAPITester:
                               f"Expected 401, got {response.status_code}")
         except Exception as e:
             self.log_result('workouts', 'Get specific workout without auth', False, str(e))
+        
+        # Test personal records and leaderboards without authentication
+        for name, path in (("Get personal records", "records"),
+                           ("Get leaderboard", f"leaderboards/{str(uuid.uuid4())}")):
+            try:
+                response = self.session.get(f"{API_BASE}/{path}")
+                if response.status_code == 401:
+                    self.log_result('workouts', f'{name} without auth', True)
+                else:
+                    self.log_result('workouts', f'{name} without auth', False, 
+                                  f"Expected 401, got {response.status_code}")
+            except Exception as e:
+                self.log_result('workouts', f'{name} without auth', False, str(e))
     
     def test_progress_tracking_api(self):
         """Test progress tracking endpoints"""
@@ -238,6 +284,17 @@ class FitnessAPITester:
         except Exception as e:
             self.log_result('progress', 'Add progress without auth', False, str(e))
         
+        # Test bulk progress import without authentication
+        try:
+            response = self.session.post(f"{API_BASE}/progress/bulk", json=[progress_data])
+            if response.status_code == 401:
+                self.log_result('progress', 'Bulk import progress without auth', True)
+            else:
+                self.log_result('progress', 'Bulk import progress without auth', False, 
+                              f"Expected 401, got {response.status_code}")
+        except Exception as e:
+            self.log_result('progress', 'Bulk import progress without auth', False, str(e))
+        
         # Test get progress without authentication
         try:
             response = self.session.get(f"{API_BASE}/progress")
@@ -279,6 +336,28 @@ class FitnessAPITester:
         except Exception as e:
             self.log_result('ai_coach', 'AI coach without auth', False, str(e))
         
+        # Test streaming AI coach without authentication
+        try:
+            response = self.session.post(f"{API_BASE}/ai/ask/stream", json=question_data)
+            if response.status_code == 401:
+                self.log_result('ai_coach', 'Streaming AI coach without auth', True)
+            else:
+                self.log_result('ai_coach', 'Streaming AI coach without auth', False, 
+                              f"Expected 401, got {response.status_code}")
+        except Exception as e:
+            self.log_result('ai_coach', 'Streaming AI coach without auth', False, str(e))
+        
+        # Test conversation history without authentication
+        try:
+            response = self.session.get(f"{API_BASE}/ai/history")
+            if response.status_code == 401:
+                self.log_result('ai_coach', 'AI history without auth', True)
+            else:
+                self.log_result('ai_coach', 'AI history without auth', False, 
+                              f"Expected 401, got {response.status_code}")
+        except Exception as e:
+            self.log_result('ai_coach', 'AI history without auth', False, str(e))
+        
         # Test AI coach with empty question
         try:
             question_data = {
@@ -309,6 +388,37 @@ class FitnessAPITester:
         except Exception as e:
             self.log_result('dashboard', 'Dashboard stats without auth', False, str(e))
     
+    def test_export_api(self):
+        """Test history export endpoint"""
+        print("\n📦 Testing History Export API...")
+        
+        # Test export without authentication
+        try:
+            response = self.session.get(f"{API_BASE}/export")
+            if response.status_code == 401:
+                self.log_result('export', 'Export without auth', True)
+            else:
+                self.log_result('export', 'Export without auth', False, 
+                              f"Expected 401, got {response.status_code}")
+        except Exception as e:
+            self.log_result('export', 'Export without auth', False, str(e))
+    
+    def test_analytics_api(self):
+        """Test analytics endpoints"""
+        print("\n📉 Testing Analytics API...")
+        
+        # Test analytics endpoints without authentication
+        for endpoint in ['volume', 'one-rep-max', 'body']:
+            try:
+                response = self.session.get(f"{API_BASE}/analytics/{endpoint}")
+                if response.status_code == 401:
+                    self.log_result('analytics', f'Analytics {endpoint} without auth', True)
+                else:
+                    self.log_result('analytics', f'Analytics {endpoint} without auth', False, 
+                                  f"Expected 401, got {response.status_code}")
+            except Exception as e:
+                self.log_result('analytics', f'Analytics {endpoint} without auth', False, str(e))
+    
     def test_user_profile_management(self):
         """Test user profile management endpoints"""
         print("\n👤 Testing User Profile Management...")
@@ -392,6 +502,8 @@ class FitnessAPITester:
         self.test_progress_tracking_api()
         self.test_ai_coach_integration()
         self.test_dashboard_stats_api()
+        self.test_export_api()
+        self.test_analytics_api()
         self.test_user_profile_management()
         
         return self.print_summary()
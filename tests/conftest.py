@@ -0,0 +1,39 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+import server  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def db(monkeypatch):
+    # Replayed upserts rely on the unique indexes to become no-ops, so tests get them too
+    database = AsyncMongoMockClient()["test_database"]
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "read_db", database)
+    await server.ensure_indexes()
+    return database
+
+
+@pytest.fixture
+async def write_queue(db, monkeypatch):
+    """A running queue of its own, so each test's writes land in its own database and event loop."""
+    queue = server.WriteQueue(maxsize=100, workers=1, batch_size=50)
+    queue.on_dropped.update(server.write_queue.on_dropped)
+    monkeypatch.setattr(server, "write_queue", queue)
+    monkeypatch.setattr(server, "WRITE_QUEUE_RETRY_BACKOFF_SECONDS", 0)
+    queue.start()
+    yield queue
+    await queue.drain(timeout=1)
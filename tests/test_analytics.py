@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+import server
+
+
+def test_moving_average_skips_missing_samples():
+    values = np.array([1.0, 2.0, np.nan, 4.0, np.nan, np.nan, 7.0])
+    averages = server.moving_average(values, 2)
+    np.testing.assert_allclose(averages, [1.0, 1.5, 2.0, 4.0, 4.0, np.nan, 7.0])
+
+
+def test_moving_average_wider_than_series():
+    np.testing.assert_allclose(server.moving_average(np.array([2.0, 4.0]), 5), [2.0, 3.0])
+    assert np.isnan(server.moving_average(np.array([np.nan, np.nan]), 3)).all()
+
+
+def test_rounded_keeps_gaps():
+    assert server.rounded(np.array([1.234, np.nan])) == [1.23, None]
+
+
+@pytest.fixture
+def leaderboard():
+    board = server.Leaderboard()
+    for member, score in [("a", 100.0), ("b", 120.0), ("c", 100.0), ("d", 90.0)]:
+        board.update(member, score)
+    return board
+
+
+def test_tied_scores_share_a_rank(leaderboard):
+    assert [leaderboard.rank(member) for member in "bcad"] == [1, 2, 2, 4]
+    assert leaderboard.rank("nobody") is None
+    assert leaderboard.top(3) == [("b", 120.0), ("a", 100.0), ("c", 100.0)]
+
+
+def test_scores_only_go_up(leaderboard):
+    leaderboard.update("b", 80.0)
+    assert leaderboard.rank("b") == 1
+    leaderboard.update("d", 100.0)
+    assert [leaderboard.rank(member) for member in "bacd"] == [1, 2, 2, 2]
+    leaderboard.update("a", 130.0)
+    assert leaderboard.top(2) == [("a", 130.0), ("b", 120.0)]
+    assert len(leaderboard) == 4
@@ -0,0 +1,59 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+USER = server.User(id="u1", email="u1@example.com", name="U1")
+SESSION_ID = server.coach_session_id(USER.id)
+EXCHANGES = 8
+
+
+@pytest.fixture
+async def history(db, write_queue, monkeypatch):
+    # Three turns per bucket, so eight exchanges fill buckets of 6, 6 and 4 messages
+    monkeypatch.setattr(server, "AI_HISTORY_BUCKET_TURNS", 3)
+    monkeypatch.setattr(server, "AI_HISTORY_BUCKET_MESSAGES", 6)
+    for turn in range(EXCHANGES):
+        await server.save_coach_exchange(USER, f"q{turn}", f"a{turn}")
+    await write_queue.join()
+    return [message for turn in range(EXCHANGES) for message in (f"q{turn}", f"a{turn}")]
+
+
+async def test_messages_are_bucketed_by_turn(db, history):
+    buckets = await db.ai_conversation_buckets.find({}, {"_id": 0}).sort("seq", 1).to_list(length=None)
+    assert [(b["id"], b["count"]) for b in buckets] == [
+        (f"{SESSION_ID}:0", 6), (f"{SESSION_ID}:1", 6), (f"{SESSION_ID}:2", 4)
+    ]
+    assert [m["index"] for b in buckets for m in b["messages"]] == list(range(2 * EXCHANGES))
+
+
+@pytest.mark.parametrize("limit", [1, 3, 4, 5, 6, 10, 16, 50])
+async def test_pages_cover_history_once(history, limit):
+    pages, cursor = [], None
+    while True:
+        messages, cursor = await server.conversation_history(SESSION_ID, limit, cursor)
+        assert 0 < len(messages) <= limit
+        pages.append([m["content"] for m in messages])
+        if cursor is None:
+            break
+    # Newest page first, each page oldest first
+    assert [content for page in reversed(pages) for content in page] == history
+    assert all(len(page) == limit for page in pages[:-1])
+
+
+async def test_replayed_exchange_is_stored_once(db, history, write_queue):
+    bucket = await db.ai_conversation_buckets.find_one({"seq": 2})
+    await write_queue.put("ai_conversation_buckets", [server.UpdateOne(
+        {"id": bucket["id"], "messages.index": {"$ne": 12}},
+        {"$push": {"messages": {"$each": bucket["messages"][:2]}}, "$inc": {"count": 2}},
+        upsert=True
+    )])
+    await write_queue.join()
+    assert (await db.ai_conversation_buckets.find_one({"seq": 2}))["count"] == 4
+
+
+async def test_invalid_cursor_is_rejected(history):
+    with pytest.raises(server.HTTPException) as error:
+        await server.conversation_history(SESSION_ID, 5, "not-a-cursor")
+    assert error.value.status_code == 400
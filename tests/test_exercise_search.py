@@ -0,0 +1,83 @@
+import pytest
+
+import server
+
+EXERCISES = [
+    {"id": "bench", "name": "Bench Press", "category": "strength", "muscle_groups": ["chest", "triceps"],
+     "instructions": "Lower the bar to your chest and press it up.", "difficulty": "intermediate",
+     "equipment": "barbell"},
+    {"id": "squat", "name": "Back Squat", "category": "strength", "muscle_groups": ["quadriceps", "glutes"],
+     "instructions": "Squat down until your thighs are parallel.", "difficulty": "intermediate",
+     "equipment": "barbell"},
+    {"id": "pushup", "name": "Push-up", "category": "strength", "muscle_groups": ["chest", "triceps"],
+     "instructions": "Keep a straight line from head to heels.", "difficulty": "beginner"},
+    {"id": "run", "name": "Running", "category": "cardio", "muscle_groups": ["legs"],
+     "instructions": "Run at a steady pace.", "difficulty": "beginner"},
+]
+
+
+@pytest.fixture
+def catalog():
+    catalog = server.ExerciseCatalog()
+    catalog.load(EXERCISES)
+    return catalog
+
+
+def result_ids(result):
+    return [exercise.id for exercise in result["results"]]
+
+
+@pytest.mark.parametrize("a, b, expected", [
+    ("squat", "squat", True),
+    ("squat", "sqaut", True),   # transposition
+    ("squat", "squad", True),   # substitution
+    ("squat", "squats", True),  # insertion
+    ("squat", "sqat", True),    # deletion
+    ("squat", "sqad", False),
+    ("squat", "squatss", False),
+    ("press", "rpess", True),
+    ("press", "sserp", False),
+])
+def test_within_one_edit(a, b, expected):
+    assert server.within_one_edit(a, b) is expected
+    assert server.within_one_edit(b, a) is expected
+
+
+def test_exact_matches_rank_above_typos_and_prefixes(catalog):
+    assert result_ids(catalog.search("chest")) == ["bench", "pushup"]
+    assert result_ids(catalog.search("bech press")) == ["bench"]
+    assert result_ids(catalog.search("squ")) == ["squat"]
+    # Every token has to match
+    assert result_ids(catalog.search("chest squat")) == []
+
+
+def test_name_matches_outrank_instruction_matches(catalog):
+    assert result_ids(catalog.search("squat"))[0] == "squat"
+    assert result_ids(catalog.search("press")) == ["bench"]
+
+
+@pytest.mark.parametrize("query", ["", "   ", "!!!", "-"])
+def test_queries_without_terms_list_everything(catalog, query):
+    result = catalog.search(query)
+    assert result["total"] == len(EXERCISES)
+    assert result_ids(result) == ["squat", "bench", "pushup", "run"]  # by name
+
+
+def test_facets_count_matches_after_filters(catalog):
+    result = catalog.search("", category="strength")
+    assert result["total"] == 3
+    assert result["facets"] == {
+        "category": {"strength": 3},
+        "difficulty": {"intermediate": 2, "beginner": 1},
+        "muscle_groups": {"chest": 2, "triceps": 2, "quadriceps": 1, "glutes": 1},
+        "equipment": {"barbell": 2},
+    }
+    assert catalog.search("chest", difficulty="beginner")["facets"]["category"] == {"strength": 1}
+
+
+def test_reload_reindexes_changed_exercises(catalog):
+    assert catalog.load(EXERCISES) is False
+    renamed = [dict(EXERCISES[0], name="Floor Press"), *EXERCISES[1:3]]
+    assert catalog.load(renamed) is True
+    assert result_ids(catalog.search("floor")) == ["bench"]
+    assert result_ids(catalog.search("running")) == []
@@ -0,0 +1,62 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+DAY = datetime(2024, 3, 6, tzinfo=timezone.utc)  # a Wednesday
+
+
+async def insert_progress(db, weight, inserted_at=None, user_id="u1", date=DAY):
+    entry = {"id": str(uuid.uuid4()), "user_id": user_id, "date": date, "weight": weight,
+             "body_fat": None, "measurements": {"waist": weight / 2}}
+    object_id = ObjectId.from_datetime(inserted_at) if inserted_at else ObjectId()
+    await db.progress.insert_one({"_id": object_id, **entry})
+    return entry
+
+
+async def rollup(db, resolution):
+    return await db.progress_rollups.find_one({"user_id": "u1", "resolution": resolution})
+
+
+async def test_backfill_and_replay_count_each_entry_once(db, write_queue):
+    an_hour_ago = datetime.now(timezone.utc) - timedelta(hours=1)
+    entries = [await insert_progress(db, weight, an_hour_ago + timedelta(seconds=i))
+               for i, weight in enumerate([80.0, 79.0, 81.0])]
+    # Inserted after the backfill's snapshot, and already applied by its own queued update
+    recent = await insert_progress(db, 78.0)
+    await server.record_progress_in_rollups([recent])
+    await write_queue.join()
+
+    for _ in range(2):
+        assert await server.backfill_progress_rollups() == 1
+        await write_queue.join()
+    await server.record_progress_in_rollups(entries + [recent])
+    await write_queue.join()
+
+    for resolution in server.ROLLUP_RESOLUTIONS:
+        bucket = await rollup(db, resolution)
+        assert bucket["count"] == 4
+        assert bucket["weight_count"] == 4
+        assert bucket["weight_sum"] == 318.0
+        assert (bucket["weight_min"], bucket["weight_max"]) == (78.0, 81.0)
+        assert bucket["measurements"]["waist"] == {"count": 4, "sum": 159.0}
+    assert await db.progress_rollups.count_documents({}) == len(server.ROLLUP_RESOLUTIONS)
+
+
+async def test_backfill_skips_while_locked(db, write_queue):
+    await insert_progress(db, 80.0)
+    async with server.maintenance_lock("progress_rollups_backfill") as acquired:
+        assert acquired
+        assert await server.backfill_progress_rollups() is None
+    assert await server.backfill_progress_rollups() == 0
+
+
+def test_bucket_start():
+    assert server.bucket_start(DAY.replace(hour=15), "day") == DAY
+    assert server.bucket_start(DAY, "week") == datetime(2024, 3, 4, tzinfo=timezone.utc)
+    assert server.bucket_start(DAY, "month") == datetime(2024, 3, 1, tzinfo=timezone.utc)
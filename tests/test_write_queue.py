@@ -0,0 +1,101 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import pytest
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+def flaky_bulk_write(monkeypatch, failures):
+    """Make bulk_write raise each of failures in turn, then behave normally; returns the call log."""
+    calls = []
+    real = mongomock.collection.Collection.bulk_write
+
+    def bulk_write(self, requests, *args, **kwargs):
+        calls.append(len(requests))
+        if len(calls) <= len(failures):
+            raise failures[len(calls) - 1]
+        return real(self, requests, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, "bulk_write", bulk_write)
+    return calls
+
+
+def write_error(code):
+    return BulkWriteError({"writeErrors": [{"index": 0, "code": code, "errmsg": f"error {code}"}]})
+
+
+async def insert_workout(db, user_id, inserted_at=None):
+    workout = {"id": str(uuid.uuid4()), "user_id": user_id, "date": datetime.now(timezone.utc), "exercises": []}
+    object_id = ObjectId.from_datetime(inserted_at) if inserted_at else ObjectId()
+    await db.workouts.insert_one({"_id": object_id, **workout})
+    return workout, object_id
+
+
+async def test_connection_failure_is_retried(db, write_queue, monkeypatch):
+    calls = flaky_bulk_write(monkeypatch, [ConnectionFailure("primary stepped down")])
+    dropped = await write_queue._write("counters", [UpdateOne({"_id": "a"}, {"$inc": {"n": 1}}, upsert=True)])
+    assert dropped == []
+    assert calls == [1, 1]
+    assert (await db.counters.find_one({"_id": "a"}))["n"] == 1
+
+
+async def test_only_transient_errors_are_retried(db, write_queue, monkeypatch):
+    calls = flaky_bulk_write(monkeypatch, [write_error(112)])
+    assert await write_queue._write("counters", [UpdateOne({"_id": "a"}, {"$inc": {"n": 1}}, upsert=True)]) == []
+    assert calls == [1, 1]
+
+    calls = flaky_bulk_write(monkeypatch, [write_error(2)])
+    assert await write_queue._write("counters", [UpdateOne({"_id": "b"}, {"$inc": {"n": 1}}, upsert=True)]) == [0]
+    assert calls == [1]
+    assert write_queue.failed == 1
+
+
+async def test_duplicate_key_is_retried_once(db, write_queue, monkeypatch):
+    calls = flaky_bulk_write(monkeypatch, [write_error(11000), write_error(11000)])
+    assert await write_queue._write("counters", [UpdateOne({"_id": "a"}, {"$inc": {"n": 1}}, upsert=True)]) == []
+    assert calls == [1, 1]
+
+
+async def test_replayed_workout_updates_count_once(db, write_queue):
+    workouts = [await insert_workout(db, "u1") for _ in range(5)]
+    assert (await server.rebuild_user_stats("u1"))["total_workouts"] == 5
+
+    # A batch re-sent after a connection failure, on top of the rebuild that already counted it
+    for _ in range(2):
+        for workout, object_id in workouts:
+            await server.record_workout_in_stats(workout, object_id)
+    await write_queue.join()
+    assert (await db.user_stats.find_one({"user_id": "u1"}))["total_workouts"] == 5
+
+    workout, object_id = await insert_workout(db, "u1")
+    for _ in range(2):
+        await server.record_workout_in_stats(workout, object_id)
+    await write_queue.join()
+    stats = await db.user_stats.find_one({"user_id": "u1"})
+    assert stats["total_workouts"] == 6
+    assert stats["recent_workouts"][0]["id"] == workout["id"]
+
+
+async def test_updates_from_before_the_snapshot_are_ignored(db, write_queue):
+    workout, object_id = await insert_workout(db, "u1", datetime.now(timezone.utc) - timedelta(hours=1))
+    await server.rebuild_user_stats("u1")
+    await server.record_workout_in_stats(workout, object_id)
+    await write_queue.join()
+    assert (await db.user_stats.find_one({"user_id": "u1"}))["total_workouts"] == 1
+
+
+async def test_dropped_stats_update_invalidates_summary(db, write_queue, monkeypatch):
+    await server.rebuild_user_stats("u1")
+    workout, object_id = await insert_workout(db, "u1")
+    flaky_bulk_write(monkeypatch, [ConnectionFailure("down")] * server.WRITE_QUEUE_RETRY_ATTEMPTS)
+    await server.record_workout_in_stats(workout, object_id)
+    await write_queue.join()
+    assert await db.user_stats.find_one({"user_id": "u1"}) is None
+    assert write_queue.failed == 1